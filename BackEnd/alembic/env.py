@@ -22,7 +22,9 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app.models.models import Base  
+# app.db.database primero: define Base y luego importa los modelos; importar
+# app.models.models antes deja a database.py a medio cargar (import circular)
+from app.db.database import Base  
 
 target_metadata = Base.metadata
 
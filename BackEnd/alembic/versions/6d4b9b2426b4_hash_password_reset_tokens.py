@@ -0,0 +1,85 @@
+"""hash password reset tokens and index active tokens
+
+Revision ID: 6d4b9b2426b4
+Revises: def858bcc56d
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6d4b9b2426b4'
+down_revision: Union[str, Sequence[str], None] = 'def858bcc56d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _columns(table: str) -> set:
+    return {c["name"] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def _indexes(table: str) -> set:
+    return {i["name"] for i in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Las BDs creadas con create_all después del cambio ya tienen el
+    # esquema nuevo: cada paso se salta si ya está aplicado
+    if "token" in _columns("password_reset_tokens"):
+        # Los tokens pendientes están en claro: se descartan (expiran en
+        # una hora y el usuario puede pedir otro)
+        op.execute(sa.text("DELETE FROM password_reset_tokens"))
+
+        indexes = _indexes("password_reset_tokens")
+        # batch_alter_table: SQLite no soporta DROP COLUMN directo
+        with op.batch_alter_table("password_reset_tokens") as batch_op:
+            if "ix_password_reset_tokens_token" in indexes:
+                batch_op.drop_index("ix_password_reset_tokens_token")
+            batch_op.add_column(sa.Column("token_hash", sa.LargeBinary(length=32), nullable=False))
+            batch_op.drop_column("token")
+
+    indexes = _indexes("password_reset_tokens")
+    if "ix_password_reset_tokens_token_hash" not in indexes:
+        op.create_index(
+            "ix_password_reset_tokens_token_hash",
+            "password_reset_tokens",
+            ["token_hash"],
+            unique=True
+        )
+    if "idx_prt_expires_used" not in indexes:
+        op.create_index(
+            "idx_prt_expires_used",
+            "password_reset_tokens",
+            ["expires_at", "is_used"]
+        )
+    if "idx_prt_active" not in indexes:
+        op.create_index(
+            "idx_prt_active",
+            "password_reset_tokens",
+            ["user_id"],
+            postgresql_where=sa.text("is_used = false"),
+            sqlite_where=sa.text("is_used = 0")
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("idx_prt_active", table_name="password_reset_tokens")
+    op.drop_index("idx_prt_expires_used", table_name="password_reset_tokens")
+    op.drop_index("ix_password_reset_tokens_token_hash", table_name="password_reset_tokens")
+    # Los hashes no permiten recuperar el token original
+    op.execute(sa.text("DELETE FROM password_reset_tokens"))
+    with op.batch_alter_table("password_reset_tokens") as batch_op:
+        batch_op.add_column(sa.Column("token", sa.String(length=255), nullable=False))
+        batch_op.drop_column("token_hash")
+    op.create_index(
+        "ix_password_reset_tokens_token",
+        "password_reset_tokens",
+        ["token"],
+        unique=True
+    )
@@ -0,0 +1,41 @@
+"""index active sessions and login alerts
+
+Revision ID: aeea7a31f4a2
+Revises: 6d4b9b2426b4
+Create Date: 2026-10-16 12:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'aeea7a31f4a2'
+down_revision: Union[str, Sequence[str], None] = '6d4b9b2426b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (nombre, tabla, columnas)
+_INDEXES = (
+    ("idx_active_session_user_active", "active_sessions", ["user_id", "is_active", "expires_at"]),
+    ("idx_active_session_expires", "active_sessions", ["expires_at"]),
+    ("idx_login_alert_user_created", "login_alerts", ["user_id", "created_at"]),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in _INDEXES:
+        # create_all ya los crea en BDs nuevas: solo faltan en BDs existentes
+        if name not in {i["name"] for i in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table, _ in reversed(_INDEXES):
+        op.drop_index(name, table_name=table)
@@ -8,7 +8,6 @@ y gestión de alertas de inicio de sesión. Implementa OAuth2 y TOTP para máxim
 
 from fastapi.responses import JSONResponse
 from app.services import security_service
-from app.services.security_service import verify_password
 import logging
 from datetime import datetime
 from typing import List, Optional
@@ -18,9 +17,9 @@ from .....schemas.auth_schemas import (
     TwoFactorSetupResponse, TwoFactorVerifyRequest
 )
 
-from fastapi import APIRouter, Depends, Form, HTTPException, Request, Response, status, Body
+from fastapi import APIRouter, BackgroundTasks, Depends, Form, HTTPException, Request, Response, status, Body
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 
 from app.db.database import get_db
 from app.models.models import User, LoginAlert
@@ -372,6 +371,7 @@ def refresh_token(
 @router.post("/login-with-2fa", response_model=Token)
 def login_with_2fa(
     request: Request,
+    background_tasks: BackgroundTasks,
     form_data: OAuth2PasswordRequestForm = Depends(),
     totp_code: str = Form(...),
     db: Session = Depends(get_db)
@@ -388,12 +388,13 @@ def login_with_2fa(
         1. Verificar credenciales básicas (email y contraseña)
         2. Validar código TOTP de 6 dígitos o código de respaldo
         3. Generar tokens de acceso y renovación
-        4. Actualizar timestamp de último inicio de sesión
-        5. Registrar evento de login y verificar si es sospechoso
+        4. Registrar evento de login y verificar si es sospechoso
+        5. Actualizar timestamp de último inicio de sesión
         6. Enviar alerta por email si el login es desde dispositivo/ubicación nueva
     
     Args:
         request (Request): Objeto Request de FastAPI para obtener IP y User-Agent
+        background_tasks (BackgroundTasks): Tareas post-respuesta (email de alerta)
         form_data (OAuth2PasswordRequestForm): Credenciales del usuario:
             - username: Dirección de email del usuario
             - password: Contraseña del usuario
@@ -418,12 +419,27 @@ def login_with_2fa(
         - Los códigos TOTP expiran después de 30 segundos
         - Los códigos de respaldo solo se pueden usar una vez
         - Se registran todos los intentos de login para análisis de seguridad
+        - El email de alerta se envía en segundo plano, tras la respuesta
     """
     try:
         # 1. Autenticar usuario con credenciales básicas
-        user = db.query(User).filter(User.email == form_data.username).first()
-        if not user or not verify_password(form_data.password, user.password_hash):
+        # (preferencias en el mismo query: las usa la alerta de login)
+        user = (
+            db.query(User)
+            .options(joinedload(User.preferences))
+            .filter(User.email == form_data.username)
+            .first()
+        )
+        if not user:
+            raise HTTPException(status_code=401, detail="Credenciales inválidas")
+        is_valid, new_hash = security_service.verify_and_update_password(
+            form_data.password, user.password_hash
+        )
+        if not is_valid:
             raise HTTPException(status_code=401, detail="Credenciales inválidas")
+        if new_hash:
+            # Se persiste en el siguiente commit
+            user.password_hash = new_hash
         
         # 2. Verificar código 2FA (TOTP o backup code)
         if not TwoFactorAuthService.verify_totp_code(user.two_factor_secret, totp_code):
@@ -440,18 +456,22 @@ def login_with_2fa(
         access_token = security_service.create_access_token(token_data)
         refresh_token = security_service.create_refresh_token(token_data)
         
-        # 4. Actualizar timestamp de último login
-        AuthService.update_last_login(user, db)
-        
-        # 5. Registrar login y verificar si se debe enviar alerta
+        # 4. Registrar login y verificar si se debe enviar alerta
+        # Antes del commit de update_last_login, que expiraría las
+        # preferencias ya cargadas con el usuario
         try:
             email_service = EmailService(api_key=RESEND_API_KEY, from_email=FROM_EMAIL)
             alert_service = LoginAlertService(email_service)
-            alert_service.record_login_and_check(user, request, db)
+            alert_service.record_login_and_check(
+                user, request, db, background_tasks=background_tasks
+            )
         except Exception as alert_error:
             # Registrar error pero no fallar el login por esto
             logger.warning(f"Failed to record login alert: {alert_error}")
         
+        # 5. Actualizar timestamp de último login
+        AuthService.update_last_login(user, db)
+        
         # Registrar login exitoso en logs
         logger.info(f"Successful login for user: {user.email}")
         
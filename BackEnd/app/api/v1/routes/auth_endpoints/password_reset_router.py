@@ -19,11 +19,14 @@ Security Features:
     - Validación estricta de contraseñas
     - Notificación por email de cambios exitosos
     - Limpieza automática de tokens expirados
+    - Límite de intentos por IP en verificación/restablecimiento de tokens
 """
 
 import logging
 import os
-from fastapi import APIRouter, Depends, HTTPException, status
+import threading
+from cachetools import TTLCache
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 
@@ -58,6 +61,49 @@ password_reset_service = PasswordResetService(
 )
 
 
+# Límite de intentos por IP sobre endpoints que consultan tokens
+# (ventana fija de 60s, en memoria por worker).
+# Limitaciones conocidas:
+#   - Cada worker lleva su propio contador: con N workers un cliente que
+#     abre conexiones nuevas puede llegar a N * TOKEN_ATTEMPTS_PER_MINUTE.
+#     Un límite global exacto requiere un almacén compartido (p.ej. Redis)
+#   - Detrás de un proxy request.client.host es la IP del proxy salvo que
+#     uvicorn se lance con --proxy-headers y --forwarded-allow-ips
+TOKEN_ATTEMPTS_PER_MINUTE = 10
+_token_attempts = TTLCache(maxsize=50000, ttl=60)
+_token_attempts_lock = threading.Lock()
+
+
+def limit_token_attempts(request: Request) -> None:
+    """
+    Dependencia que limita los intentos de verificación de tokens por IP.
+    
+    Evita la enumeración de tokens por fuerza bruta y mantiene estable la
+    carga de BD bajo abuso: al superar el límite se responde 429 sin
+    consultar la base de datos.
+    
+    Args:
+        request (Request): Request actual (para obtener la IP del cliente)
+    
+    Raises:
+        HTTPException 429: Demasiados intentos en la ventana actual
+    """
+    client_ip = request.client.host if request.client else "unknown"
+    with _token_attempts_lock:
+        # Contador mutable: incrementarlo no reinicia el TTL de la ventana
+        counter = _token_attempts.get(client_ip)
+        if counter is None:
+            counter = _token_attempts[client_ip] = [0]
+        counter[0] += 1
+        attempts = counter[0]
+    if attempts > TOKEN_ATTEMPTS_PER_MINUTE:
+        logger.warning(f"Too many reset token attempts from {client_ip}")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiados intentos. Intenta de nuevo en un minuto"
+        )
+
+
 @router.post("/request", response_model=PasswordResetResponse, status_code=status.HTTP_200_OK)
 def request_password_reset(
     request_data: PasswordResetRequest,
@@ -132,7 +178,11 @@ def request_password_reset(
         )
 
 
-@router.post("/verify-token", response_model=TokenValidationResponse)
+@router.post(
+    "/verify-token",
+    response_model=TokenValidationResponse,
+    dependencies=[Depends(limit_token_attempts)]
+)
 def verify_reset_token(
     verify_data: PasswordResetVerify,
     db: Session = Depends(get_db)
@@ -215,7 +265,11 @@ def verify_reset_token(
         )
 
 
-@router.post("/reset", response_model=PasswordResetResponse)
+@router.post(
+    "/reset",
+    response_model=PasswordResetResponse,
+    dependencies=[Depends(limit_token_attempts)]
+)
 def reset_password(
     reset_data: PasswordResetConfirm,
     db: Session = Depends(get_db)
@@ -85,6 +85,21 @@ class Settings:
     #   - Variable de entorno: DATABASE_URL
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./asistente_docs.db")
     
+    # **SQLALCHEMY_POOL_***: Pool de conexiones del engine (PostgreSQL/MySQL)
+    #   - POOL_SIZE: Conexiones persistentes (default SQLAlchemy: 5)
+    #   - MAX_OVERFLOW: Conexiones extra en picos (default SQLAlchemy: 10)
+    #   - POOL_TIMEOUT: Segundos esperando una conexión libre
+    #   - POOL_PRE_PING: Verificar conexión antes de usarla (evita conexiones muertas)
+    SQLALCHEMY_POOL_SIZE = int(os.getenv("SQLALCHEMY_POOL_SIZE", 10))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.getenv("SQLALCHEMY_MAX_OVERFLOW", 20))
+    SQLALCHEMY_POOL_TIMEOUT = int(os.getenv("SQLALCHEMY_POOL_TIMEOUT", 30))
+    SQLALCHEMY_POOL_PRE_PING = os.getenv("SQLALCHEMY_POOL_PRE_PING", "True").lower() == "true"
+    
+    # **USE_X_ACCEL**: Delegar /uploads a nginx con X-Accel-Redirect
+    #   - Solo activar si nginx sirve /internal/uploads/ (ubicación internal;)
+    #   - Sin proxy delante las descargas devolverían un 200 vacío
+    USE_X_ACCEL = os.getenv("USE_X_ACCEL", "False").lower() == "true"
+    
     # =========================================================
     #  CORS (Cross-Origin Resource Sharing)
     # =========================================================
@@ -0,0 +1,118 @@
+"""
+Middleware CORS en ASGI puro.
+
+Equivalente a CORSMiddleware de Starlette con la configuración de la app
+(allow_credentials=True, todos los métodos y headers), pero sin construir
+objetos Request/Response por petición: los headers se leen de scope y se
+añaden directamente al mensaje http.response.start.
+
+Comportamiento:
+    - Sin header Origin: la petición pasa sin tocarla
+    - Preflight (OPTIONS + Access-Control-Request-Method): se responde aquí
+      sin invocar la app (204 si el origen está permitido, 400 si no)
+    - Petición normal con origen permitido: se añaden
+      Access-Control-Allow-Origin, Access-Control-Allow-Credentials y Vary
+"""
+
+from typing import FrozenSet
+
+# Métodos anunciados en preflight (equivalente a allow_methods=["*"])
+_ALLOW_METHODS = b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"
+_PREFLIGHT_MAX_AGE = b"600"
+
+
+class FastCORSMiddleware:
+    """
+    Middleware CORS sin overhead de BaseHTTPMiddleware.
+
+    Args:
+        app: Aplicación ASGI envuelta
+        allowed_origins: Orígenes permitidos como bytes (b"*" permite todos)
+
+    Example:
+        app.add_middleware(
+            FastCORSMiddleware,
+            allowed_origins=frozenset({b"http://localhost:4200"})
+        )
+    """
+
+    def __init__(self, app, allowed_origins: FrozenSet[bytes]):
+        self.app = app
+        self.allowed_origins = allowed_origins
+        self.allow_all = b"*" in allowed_origins
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Una sola pasada sobre los headers del request
+        origin = request_method = request_headers = None
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                request_method = value
+            elif name == b"access-control-request-headers":
+                request_headers = value
+
+        if origin is None:
+            await self.app(scope, receive, send)
+            return
+
+        allowed = self.allow_all or origin in self.allowed_origins
+
+        if scope["method"] == "OPTIONS" and request_method is not None:
+            await self._preflight(send, origin if allowed else None, request_headers)
+            return
+
+        if not allowed:
+            await self.app(scope, receive, send)
+            return
+
+        cors_headers = (
+            (b"access-control-allow-origin", origin),
+            (b"access-control-allow-credentials", b"true"),
+            (b"vary", b"Origin"),
+        )
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", ()), *cors_headers]
+                }
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    async def _preflight(send, origin, request_headers) -> None:
+        """Responde un preflight CORS sin pasar por la aplicación."""
+        if origin is None:
+            body = b"Disallowed CORS origin"
+            await send({
+                "type": "http.response.start",
+                "status": 400,
+                "headers": [
+                    (b"content-type", b"text/plain; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"vary", b"Origin"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        headers = [
+            (b"access-control-allow-origin", origin),
+            (b"access-control-allow-credentials", b"true"),
+            (b"access-control-allow-methods", _ALLOW_METHODS),
+            (b"access-control-max-age", _PREFLIGHT_MAX_AGE),
+            (b"vary", b"Origin"),
+        ]
+        # allow_headers=["*"]: se reflejan los headers solicitados
+        if request_headers:
+            headers.append((b"access-control-allow-headers", request_headers))
+
+        await send({"type": "http.response.start", "status": 204, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
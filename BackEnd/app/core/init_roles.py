@@ -24,6 +24,7 @@ Notas de seguridad:
     - En producción, usar migrations con Alembic
 """
 
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
 from app.db.database import SessionLocal, engine, Base
 from app.models.models import Role
@@ -33,6 +34,18 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Roles base del sistema (se insertan en lote si faltan)
+ROLE_SEED_ROWS = (
+    {
+        "name": "admin",
+        "description": "Administrator with full system access"
+    },
+    {
+        "name": "user",
+        "description": "Regular user with standard permissions"
+    },
+)
+
 
 def init_roles(db: Session):
     """
@@ -56,11 +69,10 @@ def init_roles(db: Session):
             - No puede ver datos de otros usuarios
     
     Operación:
-        1. Define lista de roles a crear
-        2. Verifica si cada rol ya existe
-        3. Si no existe, crea nuevo Role
-        4. Realiza commit de la transacción
-        5. Registra operación en logs
+        1. Consulta en un solo SELECT qué roles de ROLE_SEED_ROWS existen
+        2. Inserta los faltantes con un único INSERT multi-fila
+        3. Realiza commit de la transacción
+        4. Registra operación en logs
     
     Args:
         db (Session): Sesión de base de datos SQLAlchemy
@@ -105,31 +117,20 @@ def init_roles(db: Session):
         - created_at: Timestamp de creación
         ```
     """
-    # Definir roles a inicializar
-    roles_data = [
-        {
-            "name": "admin",
-            "description": "Administrator with full system access"
-        },
-        {
-            "name": "user",
-            "description": "Regular user with standard permissions"
-        }
-    ]
-    
-    # Iterar sobre cada rol a crear
-    for role_data in roles_data:
-        # Verificar si el rol ya existe en la BD
-        existing_role = db.query(Role).filter(Role.name == role_data["name"]).first()
-        
-        if not existing_role:
-            # Si no existe, crear nuevo rol
-            new_role = Role(**role_data)
-            db.add(new_role)
-            logger.info(f"Created role: {role_data['name']}")
-        else:
-            # Si ya existe, no hacer nada (idempotente)
-            logger.info(f"Role already exists: {role_data['name']}")
+    # Un solo SELECT para saber qué roles existen ya
+    existing_names = set(db.scalars(
+        select(Role.name).where(Role.name.in_([row["name"] for row in ROLE_SEED_ROWS]))
+    ))
+    for name in existing_names:
+        # Si ya existe, no hacer nada (idempotente)
+        logger.info("Role already exists: %s", name)
+    
+    # Crear los que falten con un único INSERT multi-fila
+    missing_rows = [row for row in ROLE_SEED_ROWS if row["name"] not in existing_names]
+    if missing_rows:
+        db.execute(insert(Role), [dict(row) for row in missing_rows])
+        for row in missing_rows:
+            logger.info("Created role: %s", row["name"])
     
     # Guardar cambios en la BD
     try:
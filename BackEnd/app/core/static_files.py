@@ -0,0 +1,62 @@
+"""
+StaticFiles con cabeceras de caché y delegación opcional al proxy.
+
+Los archivos de /uploads (fotos de perfil) tienen nombres únicos por
+subida, así que pueden cachearse en el navegador sin riesgo de servir
+una versión vieja.
+
+Comportamiento:
+    - Respuestas 200/304: se añade Cache-Control público
+    - Con use_x_accel (settings.USE_X_ACCEL, configuración del servidor y no
+      un header del cliente), en lugar de transmitir el archivo desde Python
+      se responde con X-Accel-Redirect hacia /internal/uploads/<path> para
+      que nginx lo sirva con sendfile
+"""
+
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+# Tiempo de caché en navegador/CDN para archivos subidos
+UPLOADS_CACHE_CONTROL = "public, max-age=3600"
+# Ubicación interna (internal;) configurada en nginx para /uploads
+INTERNAL_UPLOADS_PREFIX = "/internal/uploads/"
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles que añade Cache-Control y soporta X-Accel-Redirect.
+
+    Args:
+        use_x_accel: Responder con X-Accel-Redirect en lugar del archivo
+        **kwargs: Argumentos de StaticFiles (directory, etc.)
+
+    Example:
+        app.mount(
+            "/uploads",
+            CachedStaticFiles(directory="uploads", use_x_accel=settings.USE_X_ACCEL),
+            name="uploads"
+        )
+    """
+
+    def __init__(self, *, use_x_accel: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.use_x_accel = use_x_accel
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        # La clase base valida la ruta (sin traversal) y la existencia
+        response = await super().get_response(path, scope)
+        if response.status_code not in (200, 304):
+            return response
+
+        if self.use_x_accel and isinstance(response, FileResponse):
+            return Response(
+                status_code=200,
+                headers={
+                    "X-Accel-Redirect": INTERNAL_UPLOADS_PREFIX + path.replace("\\", "/"),
+                    "Cache-Control": UPLOADS_CACHE_CONTROL,
+                },
+            )
+
+        response.headers["Cache-Control"] = UPLOADS_CACHE_CONTROL
+        return response
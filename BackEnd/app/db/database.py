@@ -17,11 +17,13 @@ Componentes:
     - get_db: Dependency injection para FastAPI
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 from dotenv import load_dotenv
 
+from app.core.config import settings
+
 # Cargar variables de entorno desde .env
 load_dotenv()
 
@@ -47,11 +49,24 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./asistente_docs.db")
 #   - Maneja reconexiones automáticas
 #   - Ejecuta queries SQL
 #   - Se reutiliza en toda la aplicación
+#   - Pool configurable por entorno (ver settings.SQLALCHEMY_POOL_*)
+_IS_SQLITE = make_url(DATABASE_URL).get_backend_name() == "sqlite"
+
+# Tamaño del pool solo para servidores de BD: SQLite en memoria usa
+# SingletonThreadPool/StaticPool, que no aceptan max_overflow/pool_timeout
+_POOL_ARGS = {} if _IS_SQLITE else {
+    "pool_size": settings.SQLALCHEMY_POOL_SIZE,
+    "max_overflow": settings.SQLALCHEMY_MAX_OVERFLOW,
+    "pool_timeout": settings.SQLALCHEMY_POOL_TIMEOUT,
+}
+
 engine = create_engine(
     DATABASE_URL,
     # Argumento específico para SQLite (allows same thread)
     # PostgreSQL/MySQL no necesitan este parámetro
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+    connect_args={"check_same_thread": False} if _IS_SQLITE else {},
+    pool_pre_ping=settings.SQLALCHEMY_POOL_PRE_PING,
+    **_POOL_ARGS
 )
 
 # =========================================================
@@ -293,6 +293,10 @@ class LoginAlert(Base):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     
     user = relationship("User", back_populates="login_alerts")
+    
+    __table_args__ = (
+        Index('idx_login_alert_user_created', 'user_id', 'created_at'),
+    )
 
     def __repr__(self):
         return f"<LoginAlert(user_id={self.user_id}, device={self.device}, suspicious={self.is_suspicious})>"
@@ -587,6 +591,12 @@ class ActiveSession(Base):
     # Relación
     user = relationship("User", back_populates="active_sessions")
     
+    __table_args__ = (
+        # get_user_sessions y el UPDATE de is_current filtran por usuario
+        Index('idx_active_session_user_active', 'user_id', 'is_active', 'expires_at'),
+        Index('idx_active_session_expires', 'expires_at'),
+    )
+    
     def __repr__(self):
         return f"<ActiveSession(user_id={self.user_id}, device={self.device}, active={self.is_active})>"
 
@@ -599,7 +609,7 @@ class PasswordResetToken(Base):
     Se envía por email al usuario. De un solo uso.
     
     Campos:
-        - token: Token único (string largo)
+        - token_hash: SHA-256 del token (el token en claro solo viaja por email)
         - expires_at: Cuándo expira (típicamente 1 hora)
         - is_used: Si ya fue usado
         - used_at: Cuándo se usó
@@ -615,13 +625,24 @@ class PasswordResetToken(Base):
         ForeignKey("users.id", ondelete="CASCADE"), 
         nullable=False
     )
-    token = Column(String(255), unique=True, nullable=False, index=True)
+    token_hash = Column(LargeBinary(32), unique=True, nullable=False, index=True)
     expires_at = Column(DateTime, nullable=False)
     is_used = Column(Boolean, default=False, nullable=False)
     used_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     
     user = relationship("User", back_populates="reset_tokens")
+    
+    __table_args__ = (
+        Index('idx_prt_expires_used', 'expires_at', 'is_used'),
+        # Índice parcial: solo tokens activos (como mucho uno por usuario)
+        Index(
+            'idx_prt_active',
+            'user_id',
+            postgresql_where=(is_used == False),
+            sqlite_where=(is_used == False)
+        ),
+    )
 
 
 class Log(Base):
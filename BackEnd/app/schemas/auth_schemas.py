@@ -13,9 +13,7 @@ from app.schemas.user_schemas import UserInfoResponse
 # ========================================
 #  EXCEPCIONES PERSONALIZADAS
 # ========================================
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["bcrypt_sha256"], deprecated="auto")
+from app.services.security_service import pwd_context
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
@@ -340,11 +340,16 @@ class AuthService:
             db.commit()
         
         # 4. ✅ Verificar contraseña (usando security_service)
-        if not security_service.verify_password(password, user.password_hash):
+        is_valid, new_hash = security_service.verify_and_update_password(password, user.password_hash)
+        if not is_valid:
             # Registrar intento fallido
             AuthService._record_failed_attempt(user, ip_address, user_agent, db)
             raise InvalidCredentialsError("Credenciales inválidas")
         
+        # Migrar hashes legacy (bcrypt) a Argon2 de forma transparente
+        if new_hash:
+            user.password_hash = new_hash
+        
         # 5. Verificar cuenta activa
         if not user.is_active:
             raise AccountLockedError("Cuenta desactivada")
@@ -23,9 +23,12 @@ Utilidad:
 """
 
 from abc import ABC, abstractmethod
+import asyncio
 import logging
 from typing import Optional
 
+from app.db.database import SessionLocal
+
 logger = logging.getLogger(__name__)
 
 
@@ -232,6 +235,32 @@ class DocumentContext:
         self.athenia_error = None
 
 
+class _OverlapContext:
+    """
+    Vista de un DocumentContext para el handler solapado.
+    
+    Lecturas y escrituras de atributos van al contexto original (los
+    campos athenia_* quedan visibles al terminar la cadena), salvo db,
+    que apunta a una sesión propia y no puede reasignarse.
+    
+    Args:
+        context (DocumentContext): Contexto compartido con la cadena
+        db: Sesión exclusiva de la rama solapada
+    """
+    
+    def __init__(self, context: DocumentContext, db):
+        object.__setattr__(self, "_context", context)
+        object.__setattr__(self, "db", db)
+    
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+    
+    def __setattr__(self, name, value):
+        if name == "db":
+            raise AttributeError("db no puede reasignarse en un handler solapado")
+        setattr(self._context, name, value)
+
+
 class DocumentHandler(ABC):
     """
     Clase base para handlers de documentos (Chain of Responsibility).
@@ -272,6 +301,18 @@ class DocumentHandler(ABC):
         
         await handler1.handle(context)
     
+    Ejecución solapada:
+        Un handler con overlap_with_next = True se ejecuta concurrentemente
+        con el resto de la cadena (asyncio.gather). Útil cuando el siguiente
+        handler no depende de su resultado, p.ej. IndexAtheniaHandler
+        (red/CPU) y LogActivityHandler (BD).
+        
+        El handler solapado recibe el contexto envuelto en _OverlapContext:
+        context.db es una sesión propia (cerrada al terminar ambas ramas)
+        y no la del resto de la cadena. Los modelos de context (p.ej.
+        context.document) siguen ligados a la sesión original, así que
+        deben leerse antes del primer await y no volver a tocarse.
+    
     Performance:
         - Cada handler típicamente 50-500ms
         - Overhead de cadena < 1ms
@@ -279,6 +320,10 @@ class DocumentHandler(ABC):
     
     _execution_count = {}
     
+    # Si es True, _handle() corre en paralelo con el siguiente handler,
+    # con una sesión de BD propia en context.db (ver _OverlapContext)
+    overlap_with_next = False
+    
     def __init__(self):
         """Inicializar handler."""
         self._next_handler = None
@@ -349,7 +394,54 @@ class DocumentHandler(ABC):
             )
             raise RuntimeError(f"Ciclo infinito detectado en {handler_name}")
         
+        # Solapar con el resto de la cadena si el handler lo permite
+        if self.overlap_with_next and self._next_handler:
+            logger.debug(
+                "Ejecutando handler %s en paralelo con %s",
+                handler_name, self._next_handler.__class__.__name__
+            )
+            # La rama solapada trabaja con su propia sesión: una Session
+            # no es segura para uso concurrente y el resto de la cadena
+            # sigue usando context.db
+            overlap_db = SessionLocal()
+            try:
+                results = await asyncio.gather(
+                    self._run_handle(
+                        _OverlapContext(context, overlap_db), handler_name, key
+                    ),
+                    self._next_handler.handle(context),
+                    return_exceptions=True
+                )
+            finally:
+                overlap_db.close()
+            # Propagar el primer error tras esperar ambas ramas
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            return
+        
         # Ejecutar handler actual
+        await self._run_handle(context, handler_name, key)
+        
+        # Continuar cadena
+        if self._next_handler:
+            logger.debug(f"Continuando: {handler_name} -> {self._next_handler.__class__.__name__}")
+            await self._next_handler.handle(context)
+        else:
+            logger.debug(f"Handler final {handler_name} completó cadena")
+    
+    async def _run_handle(self, context: DocumentContext, handler_name: str, key: str):
+        """
+        Ejecutar _handle() con logging de inicio y de errores.
+        
+        Args:
+            context (DocumentContext): Contexto a procesar
+            handler_name (str): Nombre del handler para logs
+            key (str): Clave del contador de ejecuciones
+        
+        Raises:
+            Exception: Cualquier excepción de _handle propagada
+        """
         try:
             logger.debug(
                 f"Ejecutando handler {handler_name} (intento {context.handler_execution_count[key]}) "
@@ -361,13 +453,6 @@ class DocumentHandler(ABC):
                 f"Error en handler {handler_name} para archivo {context.filename}: {e}"
             )
             raise
-        
-        # Continuar cadena
-        if self._next_handler:
-            logger.debug(f"Continuando: {handler_name} -> {self._next_handler.__class__.__name__}")
-            await self._next_handler.handle(context)
-        else:
-            logger.debug(f"Handler final {handler_name} completó cadena")
     
     @abstractmethod
     async def _handle(self, context: DocumentContext):
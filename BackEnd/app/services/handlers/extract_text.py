@@ -27,6 +27,7 @@ Notas:
     - TXT: Decodificación UTF-8 con manejo de errores
 """
 
+import asyncio
 import logging
 import io
 import PyPDF2
@@ -112,22 +113,11 @@ class ExtractTextHandler(DocumentHandler):
                 f"(mimetype: {mimetype}, size: {len(content)} bytes)"
             )
             
-            # Detectar tipo y extraer
-            if mimetype == 'application/pdf' or filename.lower().endswith('.pdf'):
-                text = self._extract_from_pdf(content, correlation_id)
-            
-            elif mimetype in [
-                'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                'application/msword'
-            ] or filename.lower().endswith(('.docx', '.doc')):
-                text = self._extract_from_docx(content, correlation_id)
-            
-            elif mimetype == 'text/plain' or filename.lower().endswith('.txt'):
-                text = content.decode('utf-8', errors='ignore')
-            
-            else:
-                logger.warning(f"Tipo no soportado para extracción: {mimetype}")
-                text = ""
+            # Detectar tipo y extraer (PyPDF2/python-docx son síncronos y
+            # CPU-bound: en un hilo para no bloquear el event loop)
+            text = await asyncio.to_thread(
+                self._extract, content, mimetype, filename, correlation_id
+            )
             
             # Guardar resultado
             context.text = text
@@ -145,6 +135,37 @@ class ExtractTextHandler(DocumentHandler):
             logger.exception(f"Error extrayendo texto: {e}")
             context.text = ""
     
+    def _extract(
+        self,
+        content: bytes,
+        mimetype: str,
+        filename: str,
+        correlation_id: str
+    ) -> str:
+        """
+        Elegir el extractor según mimetype/extensión y ejecutarlo.
+        
+        Es bloqueante: _handle lo ejecuta con asyncio.to_thread.
+        
+        Returns:
+            str: Texto extraído o "" si el tipo no está soportado
+        """
+        if mimetype == 'application/pdf' or filename.lower().endswith('.pdf'):
+            return self._extract_from_pdf(content, correlation_id)
+        
+        elif mimetype in [
+            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+            'application/msword'
+        ] or filename.lower().endswith(('.docx', '.doc')):
+            return self._extract_from_docx(content, correlation_id)
+        
+        elif mimetype == 'text/plain' or filename.lower().endswith('.txt'):
+            return content.decode('utf-8', errors='ignore')
+        
+        else:
+            logger.warning(f"Tipo no soportado para extracción: {mimetype}")
+            return ""
+    
     def _extract_from_pdf(self, content: bytes, correlation_id: str) -> str:
         """
         Extraer texto de documento PDF.
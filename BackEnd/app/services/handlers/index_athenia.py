@@ -19,12 +19,13 @@ Cadena de handlers:
 
 Características:
     - Indexación en base de datos vectorial
-    - Creación de embeddings con Gemini
+    - Creación de embeddings locales (sentence-transformers)
     - Chunificación automática del texto
     - Registro en tabla AtheniaDocumentIndex
     - Manejo graceful de errores (no falla upload)
     - Detección de texto insuficiente
     - Retry logic implícita en DocumentProcessor
+    - Se ejecuta en paralelo con LogActivityHandler (overlap_with_next)
 
 Performance:
     - Documento 1MB: 500-1000ms (depende de tamaño)
@@ -38,14 +39,47 @@ Notas de diseño:
     - Soporta reindexación manual posterior
 """
 
+import asyncio
 import logging
+import threading
+from datetime import datetime, timezone
+from types import SimpleNamespace
 from app.services.handlers.base import DocumentHandler, DocumentContext  
+from app.db.database import SessionLocal
 from app.models.models import AtheniaDocumentIndex
-from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 
+def _utc_now() -> datetime:
+    """UTC actual como datetime naive (sin utcnow(), deprecado en 3.12)."""
+    # La columna es DateTime sin zona y el resto de registros guarda UTC naive
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# Indexaciones concurrentes entre requests: 1, porque todas comparten el
+# modelo de embeddings local y el almacén Chroma (SQLite) en disco
+MAX_CONCURRENT_INDEXING = 1
+_INDEX_SEMAPHORE = asyncio.BoundedSemaphore(MAX_CONCURRENT_INDEXING)
+
+# DocumentProcessor compartido: crearlo carga el modelo de
+# sentence-transformers y abre un cliente Chroma (segundos por instancia)
+_processor = None
+_processor_lock = threading.Lock()
+
+
+def _get_processor():
+    """Devuelve el DocumentProcessor del proceso, creándolo en el primer uso."""
+    global _processor
+    if _processor is None:
+        with _processor_lock:
+            if _processor is None:
+                # Import diferido: evita dependencias circulares entre
+                # handlers, services y processors
+                from app.services.athenia.document_processor import DocumentProcessor
+                _processor = DocumentProcessor()
+    return _processor
+
+
 class IndexAtheniaHandler(DocumentHandler):  
     """
     Handler para indexación en ATHENIA.
@@ -116,8 +150,20 @@ class IndexAtheniaHandler(DocumentHandler):
             ├─ is_indexed: true
             ├─ chunks_count: N
             └─ last_indexed_at
+    
+    Concurrencia:
+        - overlap_with_next: LogActivityHandler corre mientras se indexa
+        - Chunificación/embeddings en un hilo (asyncio.to_thread) sobre una
+          copia de id/filename/text, sin tocar la sesión de BD
+        - context.db es una sesión propia (ver DocumentHandler.handle);
+          context.document solo se lee antes del primer await
+        - Un único DocumentProcessor por proceso (_get_processor)
+        - _INDEX_SEMAPHORE serializa el cálculo de embeddings (modelo
+          local) y las escrituras en Chroma
     """
     
+    overlap_with_next = True
+    
     async def _handle(self, context: DocumentContext):  
         """
         Indexar documento en ATHENIA.
@@ -125,7 +171,7 @@ class IndexAtheniaHandler(DocumentHandler):
         Operación:
             1. Verificar documento existe
             2. Validar texto suficiente
-            3. Importar DocumentProcessor
+            3. Obtener el DocumentProcessor compartido
             4. Procesar e indexar
             5. Registrar en BD
             6. Actualizar contexto
@@ -152,13 +198,14 @@ class IndexAtheniaHandler(DocumentHandler):
             - Usa context.document.text (ya extraído)
         """
         correlation_id = getattr(context, 'correlation_id', 'N/A')
+        # context.document pertenece a la sesión del resto de la cadena
+        # (que corre en paralelo): se lee solo antes del primer await
+        document_id = context.document.id if context.document else None
         
         try:
             # Paso 1: Verificar documento existe
             if not context.document:
-                logger.debug(
-                    f"No documento para indexar en ATHENIA"
-                )
+                logger.debug("No documento para indexar en ATHENIA")
                 return
             
             document = context.document
@@ -166,48 +213,56 @@ class IndexAtheniaHandler(DocumentHandler):
             # Paso 2: Validar texto suficiente
             if not document.text or len(document.text.strip()) < 50:
                 logger.debug(
-                    f"Documento {document.id} tiene texto insuficiente "
-                    f"({len(document.text) if document.text else 0} chars). "
-                    f"No indexable."
+                    "Documento %s tiene texto insuficiente (%d chars). No indexable.",
+                    document.id,
+                    len(document.text) if document.text else 0
                 )
                 context.athenia_indexed = False
                 context.athenia_chunks = 0
                 return
             
-            logger.debug(
-                f"Indexando documento {document.id} ({document.filename}) "
-                f"en ATHENIA ({len(document.text)} caracteres)"
-            )
-            
-            # Paso 3: Importar DocumentProcessor
-            # Se importa aquí para evitar dependencias circulares
-            # entre handlers, services, y processors
-            from app.services.athenia.document_processor import DocumentProcessor
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Indexando documento %s (%s) en ATHENIA (%d caracteres)",
+                    document.id, document.filename, len(document.text)
+                )
             
-            # Paso 4: Procesar e indexar
-            processor = DocumentProcessor()
-            chunks_count = processor.process_and_index(document)
+            # Paso 3-4: Procesar e indexar con el DocumentProcessor compartido
+            # (se crea en el hilo: la primera vez carga el modelo)
+            # Copia desacoplada de la sesión: el hilo no debe cargar
+            # atributos del modelo mientras otro handler hace commit
+            snapshot = SimpleNamespace(
+                id=document.id,
+                filename=document.filename,
+                text=document.text
+            )
+            async with _INDEX_SEMAPHORE:
+                chunks_count = await asyncio.to_thread(
+                    lambda: _get_processor().process_and_index(snapshot)
+                )
             
             logger.debug(
-                f"Documento {document.id} indexado. "
-                f"Chunks: {chunks_count}"
+                "Documento %s indexado. Chunks: %s", document_id, chunks_count
             )
             
             # Paso 5: Registrar en BD
             # Crea record en AtheniaDocumentIndex para tracking
             index_record = AtheniaDocumentIndex(
-                document_id=document.id,
+                document_id=document_id,
                 is_indexed=True,
                 chunks_count=chunks_count,
-                last_indexed_at=datetime.utcnow(),
+                # UTC naive, igual que la reindexación en athenia_service:
+                # func.now() usaría la zona horaria de la sesión de BD
+                last_indexed_at=_utc_now(),
                 error_message=None
             )
             
+            # context.db es la sesión propia de la rama solapada
             context.db.add(index_record)
             context.db.commit()
             
             logger.debug(
-                f"Record AtheniaDocumentIndex creado para documento {document.id}"
+                "Record AtheniaDocumentIndex creado para documento %s", document_id
             )
             
             # Paso 6: Actualizar contexto
@@ -223,9 +278,7 @@ class IndexAtheniaHandler(DocumentHandler):
             - Paquetes requeridos no instalados
             - Path de importación incorrecto
             """
-            logger.error(
-                f"Módulo ATHENIA no disponible: {str(ie)}"
-            )
+            logger.error("Módulo ATHENIA no disponible: %s", ie)
             context.athenia_indexed = False
             context.athenia_error = "Módulo ATHENIA no instalado"
             
@@ -242,27 +295,37 @@ class IndexAtheniaHandler(DocumentHandler):
             - Error en Gemini API
             - Error de BD
             """
+            # Stringificar la excepción una sola vez
+            error_msg = str(e)
             logger.error(
-                f"Error indexando documento {document.id if hasattr(context, 'document') and context.document else 'N/A'}: {str(e)}",
+                "Error indexando documento %s: %s",
+                document_id if document_id is not None else 'N/A',
+                error_msg,
                 exc_info=False  # No print de stack trace completo
             )
             
             # Intentar registrar error en BD
-            try:
-                if context.document:
+            # Sesión propia y de corta vida: context.db puede estar en estado
+            # inválido y otros handlers de la cadena siguen usándola
+            if document_id is not None:
+                error_db = SessionLocal()
+                try:
                     error_record = AtheniaDocumentIndex(
-                        document_id=context.document.id,
+                        document_id=document_id,
                         is_indexed=False,
                         chunks_count=0,
-                        error_message=str(e)[:500]  # Limitar longitud
+                        error_message=error_msg[:500]  # Limitar longitud
                     )
-                    context.db.add(error_record)
-                    context.db.commit()
-            except Exception as db_error:
-                logger.error(
-                    f"Fallo guardando registro de error en ATHENIA: {str(db_error)}"
-                )
+                    error_db.add(error_record)
+                    error_db.commit()
+                except Exception as db_error:
+                    error_db.rollback()
+                    logger.error(
+                        "Fallo guardando registro de error en ATHENIA: %s", db_error
+                    )
+                finally:
+                    error_db.close()
             
             # Actualizar contexto pero NO propagar error
             context.athenia_indexed = False
-            context.athenia_error = str(e)[:200]
+            context.athenia_error = error_msg[:200]
@@ -11,7 +11,7 @@ class LogActivityHandler(DocumentHandler):
         """
         try:
             if not context.document:
-                logging.warning(f"[{context.correlation_id}] No se puede registrar actividad: documento no creado")
+                logging.warning("[%s] No se puede registrar actividad: documento no creado", context.correlation_id)
                 return
             
             # Obtener IP address del request si está disponible
@@ -32,12 +32,14 @@ class LogActivityHandler(DocumentHandler):
             context.db.commit()
             
             logging.info(
-                f"[{context.correlation_id}] ✅ Actividad registrada: "
-                f"Usuario {context.user.email} subió {context.document.filename} "
-                f"(ID: {context.document.id})"
+                "[%s] ✅ Actividad registrada: Usuario %s subió %s (ID: %s)",
+                context.correlation_id,
+                context.user.email,
+                context.document.filename,
+                context.document.id
             )
             
         except Exception as e:
             logging.error(
-                f"[{context.correlation_id}]  Error registrando actividad: {e}"
+                "[%s]  Error registrando actividad: %s", context.correlation_id, e
             )
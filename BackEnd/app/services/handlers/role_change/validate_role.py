@@ -4,14 +4,17 @@ from fastapi import HTTPException
 from app.services.handlers.base import RoleChangeHandler
 from app.services.handlers.role_change.context import RoleChangeContext
 
+_VALID_ROLES = frozenset(("admin", "user"))
+_VALID_ROLES_REPR = str(sorted(_VALID_ROLES))
+
+
 class ValidateRoleHandler(RoleChangeHandler):
     """
     Valida que el nuevo rol sea uno de los permitidos.
     """
     def _handle(self, context: RoleChangeContext):
-        valid_roles = ["admin", "user"]
-        if context.new_role not in valid_roles:
+        if context.new_role not in _VALID_ROLES:
             raise HTTPException(
                 status_code=400,
-                detail=f"Rol inválido. Debe ser uno de {valid_roles}."
+                detail=f"Rol inválido. Debe ser uno de {_VALID_ROLES_REPR}."
             )
@@ -24,7 +24,7 @@ class SaveToDBHandler(DocumentHandler):
 
             # PROTECCIÓN: Verificar si el documento ya fue creado
             if context.document is not None:
-                logging.warning(f"[SaveToDBHandler] Documento ya existe con ID {context.document.id}, saltando creación")
+                logging.warning("[SaveToDBHandler] Documento ya existe con ID %s, saltando creación", context.document.id)
                 return  # Salir sin llamar al siguiente (la clase base lo hará)
 
             encrypted_content = getattr(context, 'encrypted_content', b'')
@@ -54,7 +54,7 @@ class SaveToDBHandler(DocumentHandler):
                 uploaded_by=context.user.id,
             )
 
-            logging.info(f"[SaveToDBHandler] Creando documento con file_type: {context.file_type}")
+            logging.info("[SaveToDBHandler] Creando documento con file_type: %s", context.file_type)
             
             context.document = crud.create_document(
                 db=context.db,
@@ -68,15 +68,15 @@ class SaveToDBHandler(DocumentHandler):
             try:
                 context.db.commit()
                 context.db.refresh(context.document)
-                logging.info(f"[SaveToDBHandler] Documento creado y confirmado: ID={context.document.id}")
+                logging.info("[SaveToDBHandler] Documento creado y confirmado: ID=%s", context.document.id)
             except Exception as commit_error:
                 context.db.rollback()
-                logging.exception(f"[SaveToDBHandler] Error en commit: {commit_error}")
+                logging.exception("[SaveToDBHandler] Error en commit: %s", commit_error)
                 raise HTTPException(status_code=500, detail="Error al confirmar documento en base de datos")
 
         except HTTPException:
             raise
         except Exception as e:
-            logging.exception(f"Error guardando documento en BD: {e}")
+            logging.exception("Error guardando documento en BD: %s", e)
             raise HTTPException(status_code=500, detail="Error al guardar en base de datos")
         
\ No newline at end of file
@@ -20,7 +20,7 @@ class ValidateFileHandler(DocumentHandler):
         try:
             file_type_enum = FileType(ext)
         except ValueError:
-            logging.error(f"[ValidateFileHandler] Tipo de archivo no soportado: .{ext}")
+            logging.error("[ValidateFileHandler] Tipo de archivo no soportado: .%s", ext)
             raise HTTPException(status_code=400, detail=f"Tipo de archivo no soportado: .{ext}")
 
         context.file_type = file_type_enum
@@ -1,15 +1,140 @@
 
 import logging
+import re
 from datetime import datetime, timedelta
+from functools import lru_cache
+from cachetools.func import ttl_cache
 from typing import Optional, Tuple
-from sqlalchemy.orm import Session
-from fastapi import Request
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session, make_transient_to_detached
+from fastapi import BackgroundTasks, Request
+from jinja2 import Template
 
-from app.models.models import User, LoginAlert, UserPreferences
+from app.db.database import SessionLocal
+from app.models.models import User, LoginAlert
 from app.services.email_service import EmailService
 
 logger = logging.getLogger(__name__)
 
+# Longitud máxima de User-Agent usada como clave de caché
+MAX_USER_AGENT_LENGTH = 512
+
+
+# Patrones precompilados: una sola pasada sobre el User-Agent por tabla
+_BROWSER_RE = re.compile(
+    r"(?P<edge>Edg)|(?P<opera>OPR|Opera)|(?P<firefox>Firefox)"
+    r"|(?P<chrome>Chrome)|(?P<safari>Safari)"
+)
+_OS_RE = re.compile(
+    r"(?P<windows>Windows)|(?P<android>Android)|(?P<ios>iPhone|iPad)"
+    r"|(?P<macos>Macintosh|Mac OS)|(?P<linux>Linux)"
+)
+
+
+# Prioridad de detección (grupo del regex, etiqueta): los tokens más
+# específicos primero, ya que Edge/Opera incluyen "Chrome" y "Safari",
+# Android incluye "Linux" e iOS incluye "Mac OS"
+_BROWSER_RULES = (
+    ("edge", "Edge"),
+    ("opera", "Opera"),
+    ("firefox", "Firefox"),
+    ("chrome", "Chrome"),
+    ("safari", "Safari"),
+)
+_OS_RULES = (
+    ("windows", "Windows"),
+    ("android", "Android"),
+    ("ios", "iOS"),
+    ("macos", "MacOS"),
+    ("linux", "Linux"),
+)
+
+
+def _match(pattern: re.Pattern, rules: tuple, text: str, default: str) -> str:
+    """Primera etiqueta de rules cuyo grupo aparece en el texto."""
+    seen = {match.lastgroup for match in pattern.finditer(text)}
+    return next((label for group, label in rules if group in seen), default)
+
+
+@lru_cache(maxsize=4096)
+def _parse_user_agent(user_agent: str) -> str:
+    """
+    Versión cacheada de LoginAlertService.parse_user_agent.
+
+    Los User-Agent se repiten mucho entre logins, así que el resultado
+    se memoiza por string (LRU acotado).
+    """
+    browser = _match(_BROWSER_RE, _BROWSER_RULES, user_agent, "Navegador desconocido")
+    os_name = _match(_OS_RE, _OS_RULES, user_agent, "Sistema desconocido")
+    return f"{browser} en {os_name}"
+
+
+# Plantilla del email de alerta: compilada una sola vez al importar.
+# autoescape evita inyectar HTML desde datos del usuario (nombre, User-Agent)
+_LOGIN_ALERT_TEMPLATE = Template("""
+                <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+                    <h2 style="color: {{ '#dc2626' if is_suspicious else '#02ab74' }};">
+                        {{ '🚨 Actividad sospechosa detectada' if is_suspicious else '🔔 Nuevo inicio de sesión' }}
+                    </h2>
+                    
+                    <p>Hola {{ user.name }},</p>
+                    
+                    <p>
+                        {{ 'Se ha detectado un inicio de sesión sospechoso en tu cuenta.' if is_suspicious
+                           else 'Se ha detectado un nuevo inicio de sesión en tu cuenta.' }}
+                    </p>
+                    
+                    <div style="background-color: #f3f4f6; padding: 20px; border-radius: 8px; margin: 20px 0;">
+                        <h3 style="margin-top: 0;">Detalles del inicio de sesión:</h3>
+                        <ul style="list-style: none; padding: 0;">
+                            <li><strong>📱 Dispositivo:</strong> {{ alert.device }}</li>
+                            <li><strong>📍 Ubicación:</strong> {{ alert.location or 'No disponible' }}</li>
+                            <li><strong>🌐 IP:</strong> {{ alert.ip_address }}</li>
+                            <li><strong>🕐 Fecha y hora:</strong> {{ alert.created_at.strftime('%d/%m/%Y %H:%M:%S') }}</li>
+                        </ul>
+                        {% if is_suspicious %}
+                        <p style="color: #dc2626; font-weight: bold;">⚠️ Este inicio de sesión es nuevo desde un dispositivo y ubicación desconocidos.</p>
+                        {% endif %}
+                    </div>
+                    
+                    <div style="background-color: {{ '#fef2f2' if is_suspicious else '#f0fdf4' }}; 
+                                border-left: 4px solid {{ '#dc2626' if is_suspicious else '#02ab74' }}; 
+                                padding: 15px; margin: 20px 0;">
+                        <p style="margin: 0;">
+                        {% if is_suspicious %}
+                            <strong>¿No fuiste tú?</strong><br>
+                            Si no reconoces este inicio de sesión, <strong>cambia tu contraseña inmediatamente</strong> y activa la autenticación de dos factores.
+                        {% else %}
+                            <strong>¿Fuiste tú?</strong><br>
+                            Si fuiste tú, puedes ignorar este mensaje. Es solo una notificación de seguridad.
+                        {% endif %}
+                        </p>
+                    </div>
+                    
+                    <p style="color: #6b7280; font-size: 12px; margin-top: 30px;">
+                        Este es un mensaje automático de seguridad. Si deseas desactivar estas alertas, 
+                        puedes hacerlo en la configuración de tu cuenta.
+                    </p>
+                </div>
+""", autoescape=True)
+
+
+@ttl_cache(maxsize=8192, ttl=3600)
+def _lookup_location(ip_address: str) -> Optional[str]:
+    """
+    Geolocalización de IP cacheada (TTL de 1 hora por reasignaciones de IP).
+
+    Al conectar un proveedor real (p.ej. MaxMind), abrir el Reader una
+    sola vez a nivel de módulo y consultarlo aquí.
+    """
+    # Implementación básica - En producción usar un servicio real
+    if ip_address.startswith("127.") or ip_address == "localhost":
+        return "Local"
+    
+    # Aquí iría la llamada a un servicio de geolocalización
+    # Por ahora retornamos una ubicación genérica
+    return "Ubicación no disponible"
+
 
 class LoginAlertService:
     """
@@ -38,33 +163,8 @@ class LoginAlertService:
         if not user_agent:
             return "Dispositivo desconocido"
         
-        # Detectar navegador
-        browser = "Navegador desconocido"
-        if "Chrome" in user_agent and "Edg" not in user_agent:
-            browser = "Chrome"
-        elif "Firefox" in user_agent:
-            browser = "Firefox"
-        elif "Safari" in user_agent and "Chrome" not in user_agent:
-            browser = "Safari"
-        elif "Edg" in user_agent:
-            browser = "Edge"
-        elif "OPR" in user_agent or "Opera" in user_agent:
-            browser = "Opera"
-        
-        # Detectar sistema operativo
-        os_name = "Sistema desconocido"
-        if "Windows" in user_agent:
-            os_name = "Windows"
-        elif "Macintosh" in user_agent or "Mac OS" in user_agent:
-            os_name = "MacOS"
-        elif "Linux" in user_agent and "Android" not in user_agent:
-            os_name = "Linux"
-        elif "Android" in user_agent:
-            os_name = "Android"
-        elif "iPhone" in user_agent or "iPad" in user_agent:
-            os_name = "iOS"
-        
-        return f"{browser} en {os_name}"
+        # Acotar la clave para que UAs patológicos no inflen la caché
+        return _parse_user_agent(user_agent[:MAX_USER_AGENT_LENGTH])
 
     @staticmethod
     def get_location_from_ip(ip_address: str) -> Optional[str]:
@@ -82,13 +182,7 @@ class LoginAlertService:
         Returns:
             String de ubicación (ej: "Madrid, España") o None
         """
-        # Implementación básica - En producción usar un servicio real
-        if ip_address.startswith("127.") or ip_address == "localhost":
-            return "Local"
-        
-        # Aquí iría la llamada a un servicio de geolocalización
-        # Por ahora retornamos una ubicación genérica
-        return "Ubicación no disponible"
+        return _lookup_location(ip_address)
 
     def check_for_suspicious_activity(
         self, 
@@ -109,24 +203,25 @@ class LoginAlertService:
         Returns:
             Tupla (es_sospechoso, es_nuevo_dispositivo, es_nueva_ubicacion)
         """
-        # Obtener los últimos logins del usuario (últimos 30 días)
+        # Obtener dispositivos/IPs de los últimos logins (últimos 30 días)
+        # Solo tuplas distintas: sin hidratar objetos ORM completos
         thirty_days_ago = datetime.utcnow() - timedelta(days=30)
         
-        recent_logins = db.query(LoginAlert).filter(
+        recent_logins = db.query(LoginAlert.device, LoginAlert.ip_address).filter(
             LoginAlert.user_id == user.id,
             LoginAlert.created_at >= thirty_days_ago
-        ).all()
+        ).distinct().all()
         
         # Si no hay logins previos, marcar como nuevo pero no sospechoso
         if not recent_logins:
             return False, True, True
         
         # Verificar si es un dispositivo conocido
-        known_devices = {login.device for login in recent_logins}
+        known_devices = {login_device for login_device, _ in recent_logins}
         is_new_device = device not in known_devices
         
         # Verificar si es una IP conocida
-        known_ips = {login.ip_address for login in recent_logins}
+        known_ips = {login_ip for _, login_ip in recent_logins}
         is_new_ip = ip_address not in known_ips
         
         # Criterios de sospecha:
@@ -135,14 +230,14 @@ class LoginAlertService:
         is_suspicious = False
         
         if is_new_device and is_new_ip:
-            # Verificar si hubo un login reciente desde otra IP
-            recent_login = db.query(LoginAlert).filter(
-                LoginAlert.user_id == user.id,
-                LoginAlert.created_at >= datetime.utcnow() - timedelta(hours=1)
-            ).order_by(LoginAlert.created_at.desc()).first()
-            
-            if recent_login and recent_login.ip_address != ip_address:
-                is_suspicious = True
+            # Verificar si hubo un login reciente desde otra IP (EXISTS)
+            is_suspicious = db.query(
+                db.query(LoginAlert).filter(
+                    LoginAlert.user_id == user.id,
+                    LoginAlert.created_at >= datetime.utcnow() - timedelta(hours=1),
+                    LoginAlert.ip_address != ip_address
+                ).exists()
+            ).scalar()
         
         return is_suspicious, is_new_device, is_new_ip
 
@@ -150,7 +245,8 @@ class LoginAlertService:
         self,
         user: User,
         request: Request,
-        db: Session
+        db: Session,
+        background_tasks: Optional[BackgroundTasks] = None
     ) -> Optional[LoginAlert]:
         """
         Registra un inicio de sesión y verifica si debe enviarse alerta
@@ -159,21 +255,24 @@ class LoginAlertService:
             user: Usuario que inicia sesión
             request: Request de FastAPI para obtener IP y User-Agent
             db: Sesión de base de datos
+            background_tasks: Si se indica, el email se envía después de
+                responder (con su propia sesión de BD) en lugar de bloquear
+                el login con el round-trip SMTP
             
         Returns:
             LoginAlert creado o None si no se debe alertar
         """
         try:
-            # Obtener preferencias del usuario
-            preferences = db.query(UserPreferences).filter(
-                UserPreferences.user_id == user.id
-            ).first()
+            # Obtener preferencias del usuario: desde la relación si ya se
+            # cargaron con el usuario (joinedload), si no con un query
+            preferences = user.preferences
             
-            # Si no tiene alertas activadas, no hacer nada
+            # Si no tiene alertas activadas, no hacer nada más: ni IP,
+            # ni parseo de User-Agent, ni geolocalización
             if not preferences or not preferences.login_alerts:
                 return None
             
-            # Extraer información del request
+            # Extraer información del request (solo si hay que alertar)
             ip_address = request.client.host if request.client else "unknown"
             user_agent = request.headers.get("user-agent", "")
             device = self.parse_user_agent(user_agent)
@@ -184,8 +283,16 @@ class LoginAlertService:
                 user, ip_address, device, db
             )
             
-            # Crear registro de login
-            login_alert = LoginAlert(
+            # ¿Se enviará notificación? Se decide antes del INSERT para
+            # guardar el flag en la misma transacción (sin segundo commit)
+            should_notify = (
+                preferences.email_notifications and
+                (is_suspicious or is_new_device or is_new_location)
+            )
+            
+            # Crear registro de login: INSERT ... RETURNING en un solo
+            # round-trip (sin el SELECT extra de db.refresh)
+            values = dict(
                 user_id=user.id,
                 device=device,
                 location=location,
@@ -194,21 +301,30 @@ class LoginAlertService:
                 is_suspicious=is_suspicious,
                 is_new_device=is_new_device,
                 is_new_location=is_new_location,
-                notification_sent=False
+                notification_sent=bool(should_notify),
+                notification_sent_at=datetime.utcnow() if should_notify else None
             )
-            
-            db.add(login_alert)
+            row = db.execute(
+                insert(LoginAlert)
+                .values(**values)
+                .returning(LoginAlert.id, LoginAlert.created_at)
+            ).one()
             db.commit()
-            db.refresh(login_alert)
             
-            # Enviar notificación si es necesario
-            should_notify = (
-                preferences.email_notifications and
-                (is_suspicious or is_new_device or is_new_location)
-            )
+            # Modelo desacoplado con identidad (no se vuelve a insertar)
+            login_alert = LoginAlert(id=row.id, created_at=row.created_at, **values)
+            make_transient_to_detached(login_alert)
             
+            # Enviar notificación si es necesario
             if should_notify:
-                self.send_login_alert_email(user, login_alert, db)
+                if background_tasks is not None:
+                    background_tasks.add_task(
+                        self._send_login_alert_in_background,
+                        user.id,
+                        login_alert.id
+                    )
+                else:
+                    self.send_login_alert_email(user, login_alert, db)
             
             return login_alert
             
@@ -217,6 +333,26 @@ class LoginAlertService:
             db.rollback()
             return None
 
+    def _send_login_alert_in_background(self, user_id: int, login_alert_id: int) -> None:
+        """
+        Envía el email de alerta fuera del request.
+        
+        La sesión del request ya está cerrada cuando corre la tarea,
+        así que se abre una sesión propia y se recargan las entidades.
+        
+        Args:
+            user_id: ID del usuario
+            login_alert_id: ID del LoginAlert a notificar
+        """
+        db = SessionLocal()
+        try:
+            user = db.get(User, user_id)
+            login_alert = db.get(LoginAlert, login_alert_id)
+            if user and login_alert:
+                self.send_login_alert_email(user, login_alert, db)
+        finally:
+            db.close()
+
     def send_login_alert_email(
         self,
         user: User,
@@ -241,50 +377,12 @@ class LoginAlertService:
             # Construir el asunto
             subject = f"⚠️ Inicio de sesión {alert_type} detectado"
             
-            # Construir el contenido HTML
-            html_content = f"""
-                <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                    <h2 style="color: {'#dc2626' if login_alert.is_suspicious else '#02ab74'};">
-                        {'🚨 Actividad sospechosa detectada' if login_alert.is_suspicious else '🔔 Nuevo inicio de sesión'}
-                    </h2>
-                    
-                    <p>Hola {user.name},</p>
-                    
-                    <p>
-                        {'Se ha detectado un inicio de sesión sospechoso en tu cuenta.' if login_alert.is_suspicious 
-                         else 'Se ha detectado un nuevo inicio de sesión en tu cuenta.'}
-                    </p>
-                    
-                    <div style="background-color: #f3f4f6; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                        <h3 style="margin-top: 0;">Detalles del inicio de sesión:</h3>
-                        <ul style="list-style: none; padding: 0;">
-                            <li><strong>📱 Dispositivo:</strong> {login_alert.device}</li>
-                            <li><strong>📍 Ubicación:</strong> {login_alert.location or 'No disponible'}</li>
-                            <li><strong>🌐 IP:</strong> {login_alert.ip_address}</li>
-                            <li><strong>🕐 Fecha y hora:</strong> {login_alert.created_at.strftime('%d/%m/%Y %H:%M:%S')}</li>
-                        </ul>
-                        
-                        {f'<p style="color: #dc2626; font-weight: bold;">⚠️ Este inicio de sesión es nuevo desde un dispositivo y ubicación desconocidos.</p>' 
-                         if login_alert.is_suspicious else ''}
-                    </div>
-                    
-                    <div style="background-color: {'#fef2f2' if login_alert.is_suspicious else '#f0fdf4'}; 
-                                border-left: 4px solid {'#dc2626' if login_alert.is_suspicious else '#02ab74'}; 
-                                padding: 15px; margin: 20px 0;">
-                        <p style="margin: 0;">
-                            <strong>{'¿No fuiste tú?' if login_alert.is_suspicious else '¿Fuiste tú?'}</strong><br>
-                            {f'Si no reconoces este inicio de sesión, <strong>cambia tu contraseña inmediatamente</strong> y activa la autenticación de dos factores.'
-                             if login_alert.is_suspicious 
-                             else 'Si fuiste tú, puedes ignorar este mensaje. Es solo una notificación de seguridad.'}
-                        </p>
-                    </div>
-                    
-                    <p style="color: #6b7280; font-size: 12px; margin-top: 30px;">
-                        Este es un mensaje automático de seguridad. Si deseas desactivar estas alertas, 
-                        puedes hacerlo en la configuración de tu cuenta.
-                    </p>
-                </div>
-            """
+            # Construir el contenido HTML (plantilla precompilada, con autoescape)
+            html_content = _LOGIN_ALERT_TEMPLATE.render(
+                user=user,
+                alert=login_alert,
+                is_suspicious=login_alert.is_suspicious
+            )
             
             # Enviar email
             success = self.email_service.send_email(
@@ -293,19 +391,44 @@ class LoginAlertService:
                 html_content=html_content
             )
             
-            if success:
-                # Marcar como enviado
+            if success and not login_alert.notification_sent:
+                # Marcar como enviado (alertas no marcadas de antemano)
                 login_alert.notification_sent = True
                 login_alert.notification_sent_at = datetime.utcnow()
                 db.commit()
-                
+            elif not success:
+                self._mark_notification_failed(login_alert, db)
             
             return success
             
         except Exception as e:
             logger.exception(f"Error sending login alert email to user {user.id}: {e}")
+            self._mark_notification_failed(login_alert, db)
             return False
 
+    @staticmethod
+    def _mark_notification_failed(login_alert: LoginAlert, db: Session) -> None:
+        """
+        Compensa el flag notification_sent guardado de antemano en
+        record_login_and_check cuando el envío falla.
+        
+        Args:
+            login_alert: Alerta cuyo envío falló
+            db: Sesión de base de datos
+        """
+        if not login_alert.notification_sent:
+            return
+        try:
+            db.execute(
+                update(LoginAlert)
+                .where(LoginAlert.id == login_alert.id)
+                .values(notification_sent=False, notification_sent_at=None)
+            )
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error reverting notification flag for alert {login_alert.id}: {e}")
+            db.rollback()
+
     @staticmethod
     def get_recent_login_alerts(
         user: User,
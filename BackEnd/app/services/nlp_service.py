@@ -1,41 +1,111 @@
+import hashlib
+import logging
+import os
+import pickle
 import re
+from collections import Counter
 from typing import List, Tuple
+import joblib
+import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import linear_kernel
 
+logger = logging.getLogger(__name__)
+
 CATEGORY_RULES = {
     "Contratos": ["contrato", "cláusula", "vencimiento", "obligación", "penalidad"],
     "Informes": ["informe", "rentabilidad", "resultados", "balance", "análisis"],
     "Artículos": ["resumen", "abstract", "referencias", "introducción"],
 }
 
+# scikit-learn solo trae stop words en inglés (stop_words="spanish" lanza
+# ValueError): lista en español resuelta una sola vez al importar
+_STOP_ES = frozenset("""
+a al algo algunas algunos ante antes como con contra cual cuales cuando de
+del desde donde durante e el ella ellas ello ellos en entre era eran es esa
+esas ese eso esos esta estaba estaban estado estar estas este esto estos
+fue fueron ha habia han hasta hay la las le les lo los mas me mi mis mucho
+muy más ni no nos nosotros o os otra otras otro otros para pero poco por
+porque que quien quienes qué se sea ser si sido sin sobre son su sus también
+tambien te tiene tienen todo todos tu tus un una unas uno unos y ya yo él
+""".split())
+_STOP_ES_LIST = sorted(_STOP_ES)
+
+# Una sola alternación (palabras más largas primero) y mapa palabra -> categoría
+_WORD_TO_CAT = {w: cat for cat, words in CATEGORY_RULES.items() for w in words}
+_ALL_WORDS_RE = re.compile("|".join(map(re.escape, sorted(_WORD_TO_CAT, key=len, reverse=True))))
+
 def guess_category(text: str) -> str:
     t = (text or "").lower()
-    scores = {cat: sum(t.count(w) for w in words) for cat, words in CATEGORY_RULES.items()}
-    best = max(scores, key=scores.get) if scores else "General"
-    return best if scores[best] > 0 else "General"
+    scores = Counter(_WORD_TO_CAT[w] for w in _ALL_WORDS_RE.findall(t))
+    if not scores:
+        return "General"
+    # max() sobre CATEGORY_RULES conserva el desempate por orden de declaración
+    return max(CATEGORY_RULES, key=scores.__getitem__)
+
+def _docs_digest(docs: List[str]) -> str:
+    h = hashlib.sha256()
+    for d in docs:
+        h.update(d.encode("utf-8", errors="ignore"))
+        h.update(b"\0")
+    return h.hexdigest()
 
 class SimpleSearcher:
-    def __init__(self, docs: List[str]):
+    def __init__(self, docs: List[str], fit: bool = True):
         self.docs = docs
-        self.vectorizer = TfidfVectorizer(stop_words="spanish", max_features=20000)
-        self.matrix = self.vectorizer.fit_transform(docs) if docs else None
+        self.vectorizer = TfidfVectorizer(stop_words=_STOP_ES_LIST, max_features=20000, dtype=np.float32)
+        self.matrix = self.vectorizer.fit_transform(docs) if docs and fit else None
+
+    def save(self, path: str) -> None:
+        # Sin compresión para poder cargar la matriz con mmap (compartida entre workers)
+        joblib.dump((_docs_digest(self.docs), self.vectorizer, self.matrix), path)
+
+    @classmethod
+    def load(cls, path: str, docs: List[str]) -> "SimpleSearcher":
+        digest, vectorizer, matrix = joblib.load(path, mmap_mode="r")
+        if digest != _docs_digest(docs):
+            raise ValueError("El índice TF-IDF en caché no corresponde a los documentos")
+        searcher = cls(docs, fit=False)
+        searcher.vectorizer = vectorizer
+        searcher.matrix = matrix
+        return searcher
+
+    @classmethod
+    def from_cache(cls, path: str, docs: List[str]) -> "SimpleSearcher":
+        if os.path.exists(path):
+            try:
+                return cls.load(path, docs)
+            # Archivo truncado/corrupto, otro formato o versión de
+            # scikit-learn, o documentos distintos: reajustar
+            except (OSError, EOFError, pickle.UnpicklingError, ValueError,
+                    TypeError, AttributeError, ImportError) as e:
+                logger.warning("Caché TF-IDF inválida en %s (%s): se reconstruye el índice", path, e)
+        searcher = cls(docs)
+        if searcher.matrix is not None:
+            searcher.save(path)
+        return searcher
 
     def search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
         if not self.docs or self.matrix is None:
             return []
         qv = self.vectorizer.transform([query])
-        sims = linear_kernel(qv, self.matrix).flatten()
-        idx_scores = sorted(enumerate(sims), key=lambda x: x[1], reverse=True)[:top_k]
-        return idx_scores
+        sims = linear_kernel(qv, self.matrix).ravel()
+        # Top-k con argpartition (O(N)); solo se ordena el corte final
+        if top_k >= len(sims):
+            idx = np.argsort(-sims, kind="stable")
+        else:
+            part = np.argpartition(-sims, top_k)[:top_k]
+            idx = part[np.argsort(-sims[part], kind="stable")]
+        return list(zip(idx.tolist(), sims[idx].tolist()))
 
 def make_snippet(text: str, query: str, radius: int = 120) -> str:
-    pattern = re.compile(re.escape(query), re.IGNORECASE)
-    m = pattern.search(text or "")
-    if not m:
-        return (text or "")[:radius*2]
-    start = max(0, m.start() - radius)
-    end = min(len(text), m.end() + radius)
+    # Búsqueda literal: str.find evita compilar un regex por llamada
+    text = text or ""
+    i = text.lower().find(query.lower())
+    if i < 0:
+        return text[:radius*2]
+    start = max(0, i - radius)
+    end = min(len(text), i + len(query) + radius)
     return (text[start:end]).replace("\n", " ").strip()
 # --- IGNORE ---
 # The code above is complete and does not require any changes. 
@@ -2,19 +2,41 @@
 Servicio de Recuperación de Contraseña
 app/services/password_reset_service.py
 """
+import asyncio
+import hashlib
+import hmac
+import os
 import secrets
+import tempfile
+import threading
 import logging
 from datetime import datetime, timedelta
 from typing import Optional
+from cachetools import TTLCache
+from sqlalchemy import delete, insert, select, update
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
 
+from app.db.database import SessionLocal
 from app.models.models import User, PasswordResetToken
 from app.schemas.auth_schemas import get_password_hash
 from app.services.email_service import EmailService
 
 logger = logging.getLogger(__name__)
 
+# Máximo de filas por DELETE en la limpieza (evita bloqueos largos)
+CLEANUP_BATCH_SIZE = 10000
+
+# Hora (UTC) de la limpieza diaria programada
+CLEANUP_HOUR_UTC = 3
+
+# Lock de archivo que elige un único worker para la limpieza programada
+CLEANUP_LOCK_PATH = os.path.join(tempfile.gettempdir(), "athenia_token_cleanup.lock")
+
+# Caché negativa: hashes de tokens inválidos recientes (no vuelven a la BD)
+_invalid_token_cache = TTLCache(maxsize=10000, ttl=300)
+_invalid_token_lock = threading.Lock()
+
 
 class PasswordResetService:
     """Servicio para gestionar recuperación de contraseñas"""
@@ -31,14 +53,28 @@ class PasswordResetService:
         self.frontend_url = frontend_url
         self.token_expiry_hours = 1
     
+    @staticmethod
+    def hash_token(token: str) -> bytes:
+        """
+        Calcula el hash con el que se guarda y busca un token
+        
+        Args:
+            token: Token en texto plano
+            
+        Returns:
+            Digest SHA-256 (32 bytes)
+        """
+        return hashlib.sha256(token.encode()).digest()
+    
     def generate_reset_token(self) -> str:
         """
         Genera un token seguro para recuperación de contraseña
         
         Returns:
-            Token aleatorio de 32 bytes en formato hexadecimal
+            Token aleatorio de 24 bytes (192 bits) en base64 URL-safe
+            (32 caracteres, sin relleno)
         """
-        return secrets.token_urlsafe(32)
+        return secrets.token_urlsafe(24)
     
     def request_password_reset(
         self,
@@ -72,24 +108,31 @@ class PasswordResetService:
                 logger.warning(f"Password reset requested for inactive user: {email}")
                 return standard_response
             
-            # Invalidar tokens anteriores del usuario
-            db.query(PasswordResetToken).filter(
-                PasswordResetToken.user_id == user.id,
-                PasswordResetToken.is_used == False
-            ).update({"is_used": True})
+            # Invalidar tokens anteriores del usuario (UPDATE Core, sin
+            # hidratar filas; usa el índice parcial idx_prt_active)
+            db.execute(
+                update(PasswordResetToken)
+                .where(
+                    PasswordResetToken.user_id == user.id,
+                    PasswordResetToken.is_used == False
+                )
+                .values(is_used=True)
+                .execution_options(synchronize_session=False)
+            )
             
             # Generar nuevo token
             reset_token = self.generate_reset_token()
             expiry_time = datetime.utcnow() + timedelta(hours=self.token_expiry_hours)
             
-            # Guardar token en BD
-            token_record = PasswordResetToken(
-                user_id=user.id,
-                token=reset_token,
-                expires_at=expiry_time,
-                is_used=False
+            # Guardar solo el hash del token en BD (misma transacción)
+            db.execute(
+                insert(PasswordResetToken).values(
+                    user_id=user.id,
+                    token_hash=self.hash_token(reset_token),
+                    expires_at=expiry_time,
+                    is_used=False
+                )
             )
-            db.add(token_record)
             db.commit()
             
             # Enviar email
@@ -126,17 +169,26 @@ class PasswordResetService:
             Token record si es válido, None si no lo es
         """
         try:
+            token_hash = self.hash_token(token)
+            
+            # Tokens inválidos repetidos se rechazan sin consultar la BD
+            with _invalid_token_lock:
+                if token_hash in _invalid_token_cache:
+                    return None
+            
             token_record = db.query(PasswordResetToken).filter(
-                PasswordResetToken.token == token,
+                PasswordResetToken.token_hash == token_hash,
                 PasswordResetToken.is_used == False
             ).first()
             
-            if not token_record:
+            if not token_record or not hmac.compare_digest(token_record.token_hash, token_hash):
                 logger.warning(f"Invalid or already used reset token")
+                self._remember_invalid(token_hash)
                 return None
             
             if token_record.expires_at < datetime.utcnow():
                 logger.warning(f"Expired reset token for user {token_record.user_id}")
+                self._remember_invalid(token_hash)
                 return None
             
             return token_record
@@ -145,6 +197,17 @@ class PasswordResetService:
             logger.exception(f"Error verifying reset token: {e}")
             return None
     
+    @staticmethod
+    def _remember_invalid(token_hash: bytes) -> None:
+        """
+        Registra un hash de token inválido en la caché negativa
+        
+        Args:
+            token_hash: Hash del token rechazado
+        """
+        with _invalid_token_lock:
+            _invalid_token_cache[token_hash] = True
+    
     def reset_password(
         self,
         token: str,
@@ -209,25 +272,112 @@ class PasswordResetService:
             )
 
     
-    def cleanup_expired_tokens(self, db: Session) -> int:
+    @staticmethod
+    def cleanup_expired_tokens(db: Session, batch_size: int = CLEANUP_BATCH_SIZE) -> int:
         """
         Limpia tokens expirados de la base de datos
         
+        Borra en lotes de batch_size filas (un commit por lote) usando el
+        índice sobre expires_at, para no mantener bloqueos largos.
+        
         Args:
             db: Sesión de base de datos
+            batch_size: Máximo de filas por DELETE
             
         Returns:
             Número de tokens eliminados
         """
         try:
-            deleted_count = db.query(PasswordResetToken).filter(
-                PasswordResetToken.expires_at < datetime.utcnow()
-            ).delete()
+            now = datetime.utcnow()
+            deleted_count = 0
+            
+            while True:
+                expired_ids = (
+                    select(PasswordResetToken.id)
+                    .where(PasswordResetToken.expires_at < now)
+                    .limit(batch_size)
+                )
+                result = db.execute(
+                    delete(PasswordResetToken)
+                    .where(PasswordResetToken.id.in_(expired_ids))
+                    .execution_options(synchronize_session=False)
+                )
+                db.commit()
+                deleted_count += result.rowcount
+                
+                if result.rowcount < batch_size:
+                    break
             
-            db.commit()
             return deleted_count
             
         except Exception as e:
             logger.exception(f"Error cleaning up expired tokens: {e}")
             db.rollback()
-            return 0
\ No newline at end of file
+            return 0
+
+
+def _seconds_until(hour: int) -> float:
+    """Segundos hasta la próxima ocurrencia de la hora indicada (UTC)."""
+    now = datetime.utcnow()
+    next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+def _run_token_cleanup() -> int:
+    """Ejecuta la limpieza con una sesión propia (fuera de requests)."""
+    with SessionLocal() as db:
+        return PasswordResetService.cleanup_expired_tokens(db)
+
+
+def _acquire_cleanup_lock():
+    """
+    Intenta tomar el lock exclusivo de la limpieza programada.
+    
+    Cada worker de uvicorn ejecuta el lifespan; solo el que obtiene el lock
+    (flock no bloqueante, liberado por el SO si el proceso muere) programa
+    la limpieza. Sin fcntl (Windows) todos la programan: es idempotente.
+    
+    Returns:
+        Archivo abierto que mantiene el lock, o None si otro worker lo tiene
+    """
+    lock_file = open(CLEANUP_LOCK_PATH, "a")
+    try:
+        import fcntl
+    except ImportError:
+        return lock_file
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+async def schedule_token_cleanup(hour: int = CLEANUP_HOUR_UTC) -> None:
+    """
+    Tarea de fondo: limpia tokens expirados una vez al día.
+    
+    Se lanza desde el lifespan de la aplicación y se cancela al cerrar.
+    Con varios workers solo uno la ejecuta (ver _acquire_cleanup_lock).
+    La limpieza (síncrona) corre en un hilo para no bloquear el event loop.
+    
+    Args:
+        hour: Hora UTC de ejecución diaria
+    """
+    lock_file = _acquire_cleanup_lock()
+    if lock_file is None:
+        logger.debug("Scheduled reset token cleanup handled by another worker")
+        return
+    try:
+        while True:
+            await asyncio.sleep(_seconds_until(hour))
+            try:
+                deleted_count = await asyncio.to_thread(_run_token_cleanup)
+                logger.info(f"Scheduled cleanup removed {deleted_count} expired reset tokens")
+            except Exception as e:
+                logger.exception(f"Error in scheduled reset token cleanup: {e}")
+    finally:
+        # Cerrar el archivo libera el lock
+        lock_file.close()
@@ -1,7 +1,7 @@
 # app/services/security_service.py
 import os
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from fastapi import HTTPException, status
@@ -17,8 +17,32 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 15))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 7))
 
+# Clave y opciones de decodificación precalculadas (se usan en cada request)
+#  - Los tokens no llevan aud/iss/jti verificables: se omiten esos validadores
+#  - exp y la firma HS256 se siguen verificando
+_SECRET_BYTES = SECRET_KEY.encode()
+_DECODE_ALGORITHMS = [ALGORITHM]
+_DECODE_OPTIONS = {
+    "verify_aud": False,
+    "verify_iss": False,
+    "verify_sub": False,
+    "verify_jti": False,
+    "verify_at_hash": False,
+}
+
 #  ÚNICA instancia de pwd_context en toda la aplicación
-pwd_context = CryptContext(schemes=["bcrypt_sha256"], deprecated="auto")
+#  - Hashes nuevos con Argon2id (costo explícito)
+#  - bcrypt_sha256 se sigue aceptando para hashes existentes y se
+#    marca como obsoleto: se rehashea en el siguiente login exitoso
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt_sha256"],
+    default="argon2",
+    deprecated="auto",
+    argon2__time_cost=2,
+    argon2__memory_cost=65536,
+    argon2__parallelism=2,
+    bcrypt_sha256__rounds=12,
+)
 
 # ========================================
 #  FUNCIONES DE PASSWORD
@@ -42,9 +66,28 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         return False
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifica la contraseña y, si el hash usa un esquema/costo obsoleto,
+    genera uno nuevo con la configuración actual.
+    
+    Args:
+        plain_password: Contraseña en texto plano
+        hashed_password: Hash almacenado en la base de datos
+        
+    Returns:
+        Tuple[bool, Optional[str]]: (es_valida, nuevo_hash o None)
+    """
+    try:
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+    except Exception as e:
+        logger.error(f"Error verificando password: {e}")
+        return False, None
+
+
 def hash_password(password: str) -> str:
     """
-    Genera un hash bcrypt_sha256 de la contraseña.
+    Genera un hash Argon2id de la contraseña.
     
     Args:
         password: Contraseña en texto plano
@@ -104,7 +147,9 @@ def decode_token(token: str) -> dict:
         HTTPException: Si el token es inválido o expirado
     """
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(
+            token, _SECRET_BYTES, algorithms=_DECODE_ALGORITHMS, options=_DECODE_OPTIONS
+        )
         return payload
     except JWTError as e:
         logger.warning(f"Token decode error: {e}")
@@ -1,11 +1,21 @@
+import hashlib
+import ipaddress
 import logging
+import re
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import List, Optional, Tuple
-from sqlalchemy.orm import Session
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from cachetools import TTLCache
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import case, insert, update
+from sqlalchemy.orm import Session, make_transient_to_detached
 from sqlalchemy.exc import SQLAlchemyError
-from fastapi import HTTPException, status
-from user_agents import parse  # pip install pycountry user-agents
+from fastapi import BackgroundTasks, HTTPException, status
 
+from app.db.database import SessionLocal
 from app.models.models import ActiveSession, User, BlacklistedToken
 from app.services import security_service
 from jose import jwt
@@ -13,6 +23,150 @@ from jose import jwt
 logger = logging.getLogger(__name__)
 
 
+# Tokens reconocibles del User-Agent, en orden de prioridad
+# (Edge y Chrome también anuncian "Safari/", Chrome también "Chrome/")
+_BROWSERS = (
+    ("Edg/", "Edge"),
+    ("OPR/", "Opera"),
+    ("Firefox/", "Firefox"),
+    ("Chrome/", "Chrome"),
+    ("Version/", "Safari"),
+    ("Safari/", "Safari"),
+)
+_OSES = (
+    ("Windows NT ", "Windows"),
+    ("Android ", "Android"),
+    ("iPhone OS ", "iOS"),
+    ("CPU OS ", "iOS"),
+    ("Mac OS X ", "Mac OS X"),
+    ("Linux", "Linux"),
+)
+_WINDOWS_VERSIONS = {"10.0": "10", "6.3": "8.1", "6.2": "8", "6.1": "7"}
+
+# Una sola regex compilada al importar: alternación de todos los tokens
+# con la versión que les sigue, resuelta en una única pasada sobre el UA
+_UA_RE = re.compile(
+    "(?P<token>"
+    + "|".join(re.escape(token) for token, _ in _BROWSERS + _OSES)
+    + r")(?P<version>[\d._]*)"
+)
+
+
+def _pick(found: dict, tokens: tuple) -> Tuple[Optional[str], str]:
+    """Primer token (por prioridad) encontrado en el UA: (etiqueta, versión)."""
+    for token, label in tokens:
+        if token in found:
+            return label, found[token].replace("_", ".").strip(".")
+    return None, ""
+
+
+@lru_cache(maxsize=4096)
+def _format_ua(user_agent: str) -> str:
+    """
+    Formatea un User-Agent (cacheado por string crudo).
+
+    Una pasada de _UA_RE recoge la primera aparición de cada token;
+    suficiente para "Chrome 120 on Windows 10" sin recorrer una lista
+    grande de patrones.
+    """
+    found = {}
+    for match in _UA_RE.finditer(user_agent):
+        found.setdefault(match.group("token"), match.group("version"))
+    
+    browser, browser_version = _pick(found, _BROWSERS)
+    os_family, os_version = _pick(found, _OSES)
+    if browser is None and os_family is None:
+        return "Dispositivo desconocido"
+    
+    browser = f"{browser or 'Other'} {browser_version.partition('.')[0]}".rstrip()
+    if os_family == "Windows":
+        os_version = _WINDOWS_VERSIONS.get(os_version, os_version)
+    os = f"{os_family or 'Other'} {os_version}".rstrip()
+    
+    # Tablet antes que Mobile: el UA de iPad también contiene "Mobile" y
+    # los tablets Android son los que NO lo incluyen
+    if (
+        "iPad" in user_agent
+        or "Tablet" in user_agent
+        or (os_family == "Android" and "Mobile" not in user_agent)
+    ):
+        return f"{browser} on {os} (Tablet)"
+    elif "Mobile" in user_agent:
+        return f"{browser} on {os} (Mobile)"
+    else:
+        return f"{browser} on {os}"
+
+
+@lru_cache(maxsize=8192)
+def _unverified_claims(token: str) -> dict:
+    """
+    Claims del JWT sin verificar firma (cacheado por token crudo).
+    
+    Los tokens malformados lanzan excepción y lru_cache no la memoriza.
+    El dict devuelto es compartido: tratarlo como solo lectura.
+    """
+    return jwt.get_unverified_claims(token)
+
+
+# Caché de geolocalización: IPs de oficinas/NAT se repiten constantemente
+LOCATION_CACHE_TTL_SECONDS = 86400
+_location_cache = TTLCache(maxsize=10_000, ttl=LOCATION_CACHE_TTL_SECONDS)
+_location_lock = threading.Lock()
+
+# Conexiones reutilizables hacia ip-api.com (evita TCP/DNS por consulta)
+_HTTP = requests.Session()
+_HTTP.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=50, max_retries=0))
+
+
+def _is_private_ip(ip_address: str) -> bool:
+    """True para IPs privadas/loopback, que no tiene sentido geolocalizar."""
+    try:
+        ip = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return False
+    return ip.is_private or ip.is_loopback
+
+
+# Actividad de sesión pendiente de persistir: {access_token_jti: last_active}.
+# Se vuelca en un único UPDATE como mucho cada ACTIVITY_FLUSH_INTERVAL_SECONDS,
+# desde la propia llamada a update_session_activity (sin tarea de fondo) y al
+# apagar la aplicación
+ACTIVITY_FLUSH_INTERVAL_SECONDS = 10
+_pending_activity: Dict[str, datetime] = {}
+_pending_activity_lock = threading.Lock()
+_last_activity_flush = time.monotonic()
+
+
+def flush_session_activity() -> int:
+    """
+    Persiste la actividad acumulada con un solo UPDATE ... CASE.
+    
+    Returns:
+        Número de sesiones actualizadas
+    """
+    global _pending_activity
+    with _pending_activity_lock:
+        pending, _pending_activity = _pending_activity, {}
+    if not pending:
+        return 0
+    
+    with SessionLocal() as db:
+        try:
+            result = db.execute(
+                update(ActiveSession)
+                .where(ActiveSession.access_token_jti.in_(list(pending)))
+                .values(last_active=case(pending, value=ActiveSession.access_token_jti))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            return result.rowcount
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.warning("Error volcando actividad de sesiones: %s", e)
+            # No es crítico: se pierde como mucho un intervalo de actividad
+            return 0
+
+
 class SessionService:
     """Servicio para gestionar sesiones activas de usuarios"""
     
@@ -27,20 +181,8 @@ class SessionService:
         Returns:
             String formateado como "Chrome 120 on Windows 10"
         """
-        try:
-            ua = parse(user_agent)
-            browser = f"{ua.browser.family} {ua.browser.version_string.split('.')[0]}"
-            os = f"{ua.os.family} {ua.os.version_string}" if ua.os.version_string else ua.os.family
-            
-            if ua.is_mobile:
-                return f"{browser} on {os} (Mobile)"
-            elif ua.is_tablet:
-                return f"{browser} on {os} (Tablet)"
-            else:
-                return f"{browser} on {os}"
-        except Exception as e:
-            logger.warning(f"Error parsing user agent: {e}")
-            return "Dispositivo desconocido"
+        # Normalizar espacios para maximizar aciertos de caché
+        return _format_ua(" ".join((user_agent or "").split()))
     
     @staticmethod
     def get_location_from_ip(ip_address: str) -> str:
@@ -53,25 +195,30 @@ class SessionService:
         Returns:
             String con ubicación o "Ubicación desconocida"
         """
-        # TODO: Implementar con API de geolocalización
-        # Opciones: ipapi.co, ip-api.com, ipinfo.io
-        
-        # Por ahora retornar placeholder
-        if ip_address in ["127.0.0.1", "localhost", "unknown"]:
+        if ip_address in ["localhost", "unknown"] or _is_private_ip(ip_address):
             return "Conexión local"
         
-        # Ejemplo con ip-api.com (requiere requests)
+        with _location_lock:
+            cached = _location_cache.get(ip_address)
+        if cached is not None:
+            return cached
+        
+        # Consulta a ip-api.com
         try:
-            import requests
-            response = requests.get(f"http://ip-api.com/json/{ip_address}", timeout=2)
+            response = _HTTP.get(f"http://ip-api.com/json/{ip_address}", timeout=2)
             if response.status_code == 200:
                 data = response.json()
                 if data.get("status") == "success":
                     city = data.get("city", "")
                     country = data.get("country", "")
-                    return f"{city}, {country}" if city and country else country or "Ubicación desconocida"
+                    location = f"{city}, {country}" if city and country else country or "Ubicación desconocida"
+                    # Solo se cachean respuestas válidas: un fallo puntual
+                    # de la API no debe fijar "desconocida" durante un día
+                    with _location_lock:
+                        _location_cache[ip_address] = location
+                    return location
         except Exception as e:
-            logger.warning(f"Error getting location for IP {ip_address}: {e}")
+            logger.warning("Error getting location for IP %s: %s", ip_address, e)
         
         return "Ubicación desconocida"
     
@@ -87,7 +234,7 @@ class SessionService:
             JTI o None si no se puede extraer
         """
         try:
-            unverified_payload = jwt.get_unverified_claims(token)
+            unverified_payload = _unverified_claims(token)
             return unverified_payload.get("jti")
         except Exception as e:
             logger.warning(f"Error extracting JTI from token: {e}")
@@ -101,11 +248,16 @@ class SessionService:
         ip_address: str,
         user_agent: str,
         db: Session,
-        is_current: bool = True
+        is_current: bool = True,
+        background_tasks: Optional[BackgroundTasks] = None
     ) -> ActiveSession:
         """
         Crea una nueva sesión activa en la base de datos
         
+        Nota: el flujo de login actual (AuthService) todavía no llama a este
+        método; quien lo integre debe pasar los BackgroundTasks del endpoint
+        para no bloquear la respuesta con la geolocalización.
+        
         Args:
             user_id: ID del usuario
             access_token: Token de acceso JWT
@@ -114,6 +266,9 @@ class SessionService:
             user_agent: User-Agent del cliente
             db: Sesión de base de datos
             is_current: Si es la sesión actual del request
+            background_tasks: Si se indica, la ubicación se resuelve después
+                de responder (la sesión se crea con location=None) en lugar
+                de bloquear el login con la llamada a la API de geolocalización
             
         Returns:
             ActiveSession creada
@@ -125,13 +280,12 @@ class SessionService:
             
             if not access_jti or not refresh_jti:
                 logger.warning("No se pudo extraer JTI de los tokens")
-                # Usar hash como fallback
-                import hashlib
-                access_jti = hashlib.sha256(access_token.encode()).hexdigest()[:50]
-                refresh_jti = hashlib.sha256(refresh_token.encode()).hexdigest()[:50]
+                # Usar hash como fallback (digest de 25 bytes = 50 hex)
+                access_jti = hashlib.blake2b(access_token.encode("ascii"), digest_size=25).hexdigest()
+                refresh_jti = hashlib.blake2b(refresh_token.encode("ascii"), digest_size=25).hexdigest()
             
             # Decodificar refresh token para obtener expiración
-            refresh_payload = jwt.get_unverified_claims(refresh_token)
+            refresh_payload = _unverified_claims(refresh_token)
             expires_timestamp = refresh_payload.get("exp")
             expires_at = datetime.fromtimestamp(expires_timestamp) if expires_timestamp else (
                 datetime.utcnow() + timedelta(days=7)
@@ -139,17 +293,23 @@ class SessionService:
             
             # Extraer información del dispositivo
             device = SessionService.extract_device_info(user_agent)
-            location = SessionService.get_location_from_ip(ip_address)
+            location = (
+                None if background_tasks is not None
+                else SessionService.get_location_from_ip(ip_address)
+            )
             
             # Marcar otras sesiones como no actuales si esta es actual
+            # (sin sincronizar el identity map: no hay entidades cargadas)
             if is_current:
                 db.query(ActiveSession).filter(
                     ActiveSession.user_id == user_id,
                     ActiveSession.is_current == True
-                ).update({"is_current": False})
+                ).update({"is_current": False}, synchronize_session=False)
             
-            # Crear nueva sesión
-            session = ActiveSession(
+            # Crear nueva sesión: INSERT ... RETURNING en la misma transacción,
+            # un solo commit y sin SELECT de refresh posterior
+            now = datetime.utcnow()
+            values = dict(
                 user_id=user_id,
                 access_token_jti=access_jti,
                 refresh_token_jti=refresh_jti,
@@ -157,16 +317,25 @@ class SessionService:
                 ip_address=ip_address,
                 user_agent=user_agent,
                 location=location,
-                created_at=datetime.utcnow(),
-                last_active=datetime.utcnow(),
+                created_at=now,
+                last_active=now,
                 expires_at=expires_at,
                 is_current=is_current,
                 is_active=True
             )
-            
-            db.add(session)
+            session_id = db.execute(
+                insert(ActiveSession).values(**values).returning(ActiveSession.id)
+            ).scalar_one()
             db.commit()
-            db.refresh(session)
+            
+            # Modelo desacoplado con identidad (no se vuelve a insertar)
+            session = ActiveSession(id=session_id, **values)
+            make_transient_to_detached(session)
+            
+            if background_tasks is not None:
+                background_tasks.add_task(
+                    SessionService._enrich_location, session.id, ip_address
+                )
             
             return session
             
@@ -178,6 +347,31 @@ class SessionService:
                 detail="Error al crear sesión"
             )
     
+    @staticmethod
+    def _enrich_location(session_id: int, ip_address: str) -> None:
+        """
+        Resuelve la ubicación de una sesión fuera del request.
+        
+        La sesión del request ya está cerrada cuando corre la tarea,
+        así que se abre una sesión propia de BD.
+        
+        Args:
+            session_id: ID de la ActiveSession a completar
+            ip_address: IP del cliente
+        """
+        location = SessionService.get_location_from_ip(ip_address)
+        db = SessionLocal()
+        try:
+            db.query(ActiveSession).filter(
+                ActiveSession.id == session_id
+            ).update({"location": location}, synchronize_session=False)
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.warning("Error guardando ubicación de sesión %s: %s", session_id, e)
+        finally:
+            db.close()
+    
     @staticmethod
     def get_user_sessions(user_id: int, db: Session, active_only: bool = True) -> List[ActiveSession]:
         """
@@ -307,15 +501,29 @@ class SessionService:
             if except_current and current_session_id:
                 query = query.filter(ActiveSession.id != current_session_id)
             
-            sessions = query.all()
+            # Solo se necesitan id y JTIs, no las entidades completas
+            sessions = query.with_entities(
+                ActiveSession.id,
+                ActiveSession.access_token_jti,
+                ActiveSession.refresh_token_jti
+            ).all()
             count = len(sessions)
             
-            # Agregar tokens a blacklist
-            for session in sessions:
-                db.add(BlacklistedToken(token=session.access_token_jti, blacklisted_at=datetime.utcnow()))
-                db.add(BlacklistedToken(token=session.refresh_token_jti, blacklisted_at=datetime.utcnow()))
-                db.delete(session)
-            
+            # Agregar tokens a blacklist en un solo lote
+            now = datetime.utcnow()
+            db.bulk_save_objects([
+                BlacklistedToken(token=jti, blacklisted_at=now)
+                for session in sessions
+                for jti in (session.access_token_jti, session.refresh_token_jti)
+            ])
+            
+            # Eliminar con un único DELETE solo las sesiones cuyos JTIs se
+            # añadieron a la blacklist: una sesión creada entre el SELECT y
+            # el DELETE no debe borrarse sin revocar sus tokens
+            if sessions:
+                db.query(ActiveSession).filter(
+                    ActiveSession.id.in_([session.id for session in sessions])
+                ).delete(synchronize_session=False)
             db.commit()
                         
             return {
@@ -336,20 +544,22 @@ class SessionService:
         """
         Actualiza el timestamp de última actividad de una sesión
         
+        Registra la actividad en memoria; si pasó el intervalo desde el
+        último volcado, la llamada actual persiste el lote acumulado.
+        
         Args:
             access_token_jti: JTI del token de acceso
-            db: Sesión de base de datos
+            db: Sesión de base de datos (no se usa; se mantiene la firma)
         """
-        try:
-            db.query(ActiveSession).filter(
-                ActiveSession.access_token_jti == access_token_jti
-            ).update({"last_active": datetime.utcnow()})
-            
-            db.commit()
-            
-        except SQLAlchemyError as e:
-            logger.warning(f"Error actualizando actividad de sesión: {e}")
-            # No lanzar excepción, no es crítico
+        global _last_activity_flush
+        now = time.monotonic()
+        with _pending_activity_lock:
+            _pending_activity[access_token_jti] = datetime.utcnow()
+            flush_due = now - _last_activity_flush >= ACTIVITY_FLUSH_INTERVAL_SECONDS
+            if flush_due:
+                _last_activity_flush = now
+        if flush_due:
+            flush_session_activity()
     
     @staticmethod
     def cleanup_expired_sessions(db: Session) -> int:
@@ -363,12 +573,10 @@ class SessionService:
             Número de sesiones eliminadas
         """
         try:
-            expired = db.query(ActiveSession).filter(
+            # El rowcount del DELETE ya es el conteo: sin SELECT COUNT previo
+            count = db.query(ActiveSession).filter(
                 ActiveSession.expires_at < datetime.utcnow()
-            )
-            
-            count = expired.count()
-            expired.delete()
+            ).delete(synchronize_session=False)
             db.commit()
             
             return count
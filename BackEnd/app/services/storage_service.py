@@ -1,5 +1,8 @@
+import base64
 import os
-from cryptography.fernet import Fernet
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,13 +17,29 @@ def _load_or_create_key():
         f.write(key)
     return key
 
-_FERNET = Fernet(_load_or_create_key())
+_KEY = _load_or_create_key()
+# AES-256-GCM sobre los 32 bytes de la clave Fernet existente
+_AEAD = AESGCM(base64.urlsafe_b64decode(_KEY)[:32])
+# Solo para descifrar blobs guardados antes del cambio a AES-GCM
+_FERNET = Fernet(_KEY)
+
+# Prefijo de formato: los tokens Fernet siempre empiezan por b"g" (0x80 en base64)
+_AEAD_VERSION = b"\x01"
+_NONCE_SIZE = 12
 
 def encrypt_bytes(data: bytes) -> bytes:
-    return _FERNET.encrypt(data)
+    nonce = os.urandom(_NONCE_SIZE)
+    return _AEAD_VERSION + nonce + _AEAD.encrypt(nonce, data, None)
 
 def decrypt_bytes(token: bytes) -> bytes:
-    return _FERNET.decrypt(token)
+    if token[:1] != _AEAD_VERSION:
+        return _FERNET.decrypt(token)
+    nonce = token[1:1 + _NONCE_SIZE]
+    try:
+        return _AEAD.decrypt(nonce, token[1 + _NONCE_SIZE:], None)
+    except InvalidTag:
+        # Mismo contrato que Fernet para los llamadores
+        raise InvalidToken
 
 
 def delete_file(file_path: str) -> bool:
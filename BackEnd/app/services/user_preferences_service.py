@@ -1,9 +1,10 @@
 import os
 import logging
-from typing import Optional, List
+from typing import BinaryIO, Optional, List
 import uuid
 from sqlalchemy.orm import Session
 from fastapi import UploadFile, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 
 from app.models.models import User, UserPreferences
 from app.schemas.user_preferences_schemas import (
@@ -16,76 +17,22 @@ from app.services.email_service import EmailService
 
 logger = logging.getLogger(__name__)
 
-def remove_file(self, file_path: str):
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            else:
-                logger.warning(f"File not found: {file_path}")
-        except Exception as e:
-            logger.warning(f"Failed to delete file {file_path}: {e}")
+# Tamaño de bloque al copiar archivos subidos a disco
+COPY_CHUNK_SIZE = 64 * 1024
+
+# Extensiones permitidas para fotos de perfil
+ALLOWED_EXTENSIONS = frozenset((".jpg", ".jpeg", ".png", ".webp"))
+_ALLOWED_EXTENSIONS_REPR = ", ".join(sorted(ALLOWED_EXTENSIONS))
+
 
 class UserPreferencesService:
     UPLOAD_DIR = "uploads/profile_photos"
-    ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
     MAX_FILE_SIZE = 5 * 1024 * 1024  # 5 MB
     
     def __init__(self, email_service: EmailService):
         self.email_service = email_service
         os.makedirs(self.UPLOAD_DIR, exist_ok=True)
     
-    def upload_profile_photo(self, user: User, file: UploadFile, db: Session) -> str:
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        if file_ext not in self.ALLOWED_EXTENSIONS:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Formato de archivo no permitido. Use: {', '.join(self.ALLOWED_EXTENSIONS)}"
-            )
-
-        # Validar tamaño del archivo
-        file_size = len(file.file.read())  # Get size without moving file pointer
-        if file_size > self.MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"El archivo es demasiado grande. Máximo: {self.MAX_FILE_SIZE / 1024 / 1024}MB"
-            )
-
-        # Generar nombre único
-        filename = f"user_{user.id}_{uuid.uuid4().hex}{file_ext}"
-        file_path = os.path.join(self.UPLOAD_DIR, filename)
-
-        try:
-            # Guardar archivo
-            with open(file_path, "wb") as buffer:
-                buffer.write(file.file.read())
-            
-            # Eliminar foto anterior si existe
-            prefs = self.get_or_create_preferences(user, db)
-            if prefs.profile_photo_url:
-                old_file_path = prefs.profile_photo_url.replace("/uploads/", "uploads/")
-                remove_file(old_file_path)
-
-            # Actualizar URL en base de datos
-            photo_url = f"/uploads/profile_photos/{filename}"
-            prefs.profile_photo_url = photo_url
-            db.commit()
-
-            return photo_url
-
-        except Exception as e:
-            logger.error(f"Error uploading profile photo for user {user.id}: {e}")
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except:
-                    pass
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error al subir la foto de perfil"
-            )
-    
-    
-
     @staticmethod
     def get_or_create_preferences(user: User, db: Session) -> UserPreferences:
         """
@@ -273,7 +220,7 @@ class UserPreferencesService:
         
         return user
     
-    def upload_profile_photo(
+    async def upload_profile_photo(
         self,
         user: User,
         file: UploadFile,
@@ -294,22 +241,12 @@ class UserPreferencesService:
             HTTPException: Si el archivo no es válido
         """
         # Validar extensión
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        if file_ext not in self.ALLOWED_EXTENSIONS:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Formato de archivo no permitido. Use: {', '.join(self.ALLOWED_EXTENSIONS)}"
-            )
-        
-        # Validar tamaño
-        file.file.seek(0, 2)  # Ir al final del archivo
-        file_size = file.file.tell()
-        file.file.seek(0)  # Volver al inicio
-        
-        if file_size > self.MAX_FILE_SIZE:
+        _, dot, ext = file.filename.rpartition(".")
+        file_ext = f".{ext.lower()}" if dot else ""
+        if file_ext not in ALLOWED_EXTENSIONS:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"El archivo es demasiado grande. Máximo: {self.MAX_FILE_SIZE / 1024 / 1024}MB"
+                detail=f"Formato de archivo no permitido. Use: {_ALLOWED_EXTENSIONS_REPR}"
             )
         
         # Generar nombre único
@@ -317,9 +254,8 @@ class UserPreferencesService:
         file_path = os.path.join(self.UPLOAD_DIR, filename)
         
         try:
-            # Guardar archivo
-            with open(file_path, "wb") as buffer:
-                buffer.write(file.file.read())
+            # Guardar archivo en un hilo: la escritura a disco no bloquea el event loop
+            await run_in_threadpool(self._copy_upload, file.file, file_path)
             
             # Eliminar foto anterior si existe
             prefs = self.get_or_create_preferences(user, db)
@@ -339,12 +275,14 @@ class UserPreferencesService:
             return photo_url
             
         except Exception as e:
-            logger.error(f"Error uploading profile photo for user {user.id}: {e} - Filename: {file.filename}")
             if os.path.exists(file_path):
                 try:
                     os.remove(file_path)
                 except:
                     pass
+            if isinstance(e, HTTPException):
+                raise
+            logger.error(f"Error uploading profile photo for user {user.id}: {e} - Filename: {file.filename}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error al subir la foto de perfil"
@@ -352,6 +290,34 @@ class UserPreferencesService:
 
     
     
+    def _copy_upload(self, source: BinaryIO, file_path: str) -> int:
+        """
+        Copia el archivo subido a disco por bloques, validando el tamaño
+        durante la copia (sin leerlo entero en memoria).
+        
+        Args:
+            source: Stream del archivo subido
+            file_path: Ruta destino
+            
+        Returns:
+            Bytes escritos
+            
+        Raises:
+            HTTPException: Si el archivo supera MAX_FILE_SIZE
+        """
+        source.seek(0)
+        file_size = 0
+        with open(file_path, "wb") as buffer:
+            while chunk := source.read(COPY_CHUNK_SIZE):
+                file_size += len(chunk)
+                if file_size > self.MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"El archivo es demasiado grande. Máximo: {self.MAX_FILE_SIZE / 1024 / 1024}MB"
+                    )
+                buffer.write(chunk)
+        return file_size
+    
     def delete_profile_photo(self, user: User, db: Session) -> bool:
         """
         Elimina la foto de perfil del usuario
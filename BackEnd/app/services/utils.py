@@ -1,8 +1,79 @@
 import io
-import fitz  # PyMuPDF
-import docx
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
 from fastapi import UploadFile, HTTPException
 
+# PDFs con al menos estas páginas se extraen en paralelo por rangos
+PDF_PARALLEL_MIN_PAGES = 64
+PDF_MAX_WORKERS = 4
+
+# Pool de procesos compartido, creado en el primer PDF grande.
+# "spawn": hacer fork de un worker de uvicorn con hilos (threadpool de
+# anyio, pool de SQLAlchemy) puede heredar locks tomados y bloquearse
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """Devuelve el pool de extracción de PDF, creándolo si no existe."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=PDF_MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pdf_pool
+
+
+def shutdown_pdf_pool() -> None:
+    """Cierra el pool de extracción de PDF (al apagar la aplicación)."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is not None:
+            _pdf_pool.shutdown(cancel_futures=True)
+            _pdf_pool = None
+
+
+def _pdf_range_text(path: str, start: int, stop: int) -> str:
+    """Texto de las páginas [start, stop) con un Document propio del worker."""
+    import fitz  # PyMuPDF
+    with fitz.open(path) as doc:
+        return "".join(doc[i].get_text() for i in range(start, stop))
+
+
+def _pdf_text_parallel(data: bytes, page_count: int) -> str:
+    """
+    Extrae el texto de un PDF grande repartiendo rangos de páginas.
+
+    PyMuPDF no es thread-safe (ni siquiera con un Document por hilo),
+    así que se usan procesos. El PDF se escribe una vez a un archivo
+    temporal y cada worker lo abre por ruta, en lugar de recibir una
+    copia serializada de los bytes.
+
+    Es bloqueante: desde código async llamar vía asyncio.to_thread.
+    """
+    step = -(-page_count // PDF_MAX_WORKERS)
+    starts = range(0, page_count, step)
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(data)
+        texts = _get_pdf_pool().map(
+            _pdf_range_text,
+            [path] * len(starts),
+            starts,
+            [min(start + step, page_count) for start in starts]
+        )
+        return "".join(texts)
+    finally:
+        os.remove(path)
+
+
 def extract_text(file: io.BytesIO, filename: str) -> str:
     """
     Extrae el texto de un archivo (PDF, DOCX, TXT) dado un flujo de bytes.
@@ -11,19 +82,29 @@ def extract_text(file: io.BytesIO, filename: str) -> str:
     name = filename.lower()
     data = file.read()
     if name.endswith(".pdf"):
-        text = ""
+        # Imports diferidos: PyMuPDF/python-docx son costosos de cargar
+        # y solo se necesitan para su formato
+        import fitz  # PyMuPDF
         with fitz.open(stream=data, filetype="pdf") as doc:
-            for page in doc:
-                text += page.get_text()
-        return text
+            if doc.page_count < PDF_PARALLEL_MIN_PAGES:
+                return "".join(page.get_text() for page in doc)
+            page_count = doc.page_count
+        return _pdf_text_parallel(data, page_count)
     elif name.endswith(".docx"):
+        import docx
         mem = io.BytesIO(data)
         d = docx.Document(mem)
         return "\n".join(p.text for p in d.paragraphs)
     elif name.endswith(".txt"):
+        # Camino rápido: UTF-8 estricto (con o sin BOM) cubre casi todo
         try:
-            return data.decode("utf-8", errors="ignore")
-        except:
-            return data.decode("latin-1", errors="ignore")
+            return data.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            pass
+        # Otra codificación (p.ej. Latin-1/cp1252): detectarla en vez de
+        # descartar bytes en silencio
+        from charset_normalizer import from_bytes
+        best = from_bytes(data).best()
+        return str(best) if best is not None else data.decode("latin-1")
     else:
         raise HTTPException(status_code=400, detail="Formato no soportado")
@@ -5,73 +5,133 @@ Configuración de la API del asistente documental con autenticación,
 gestión de documentos y asistente conversacional.
 """
 
+import asyncio
 import logging
+import logging.config
+import orjson
 from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import os
-from fastapi.staticfiles import StaticFiles
-from sqlalchemy import text
+from sqlalchemy import inspect, select
 
 from app.core.config import settings
+from app.core.cors import FastCORSMiddleware
+from app.core.static_files import CachedStaticFiles
 from app.db.database import Base, engine, SessionLocal
 from app.api.v1.routes.auth_endpoints import router as auth_router
 from app.api.v1.routes.documents_endpoints import router as docs_router
-from app.api.v1.routes.assistant import router as assist_router
 from app.core.init_roles import init_roles
 from app.models.models import Role
+from app.services.password_reset_service import schedule_token_cleanup
+from app.services.utils import shutdown_pdf_pool
+from app.services.session_service import flush_session_activity
 
 load_dotenv()
 
-# Validar configuración de ATHENIA
-try:
-    settings.validate_athenia()
-except ValueError as e:
-    logging.error(f"⚠️ Error de configuración: {e}")
-    print("\n⚠️  ATHENIA no está completamente configurado.")
-    print("📝 Por favor, agrega tu GEMINI_API_KEY en el archivo .env\n")
-
-ALLOWED_ORIGINS = [
-    origin.strip() 
+# Orígenes CORS como bytes: FastCORSMiddleware compara contra el header crudo
+ALLOWED_ORIGINS = frozenset(
+    origin.strip().encode("ascii")
     for origin in os.getenv("ALLOWED_ORIGINS", "http://localhost:4200").split(",")
-]
+    if origin.strip()
+)
 
-logging.basicConfig(level=logging.INFO)
+# Configuración de logging una sola vez (reemplaza handlers previos del root,
+# p.ej. el basicConfig de init_roles, sin desactivar loggers ya creados)
+logging.config.dictConfig({
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "default": {
+            "format": "%(asctime)s %(levelname)s %(name)s: %(message)s"
+        }
+    },
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+            "formatter": "default"
+        }
+    },
+    "root": {
+        "level": os.getenv("LOG_LEVEL", "INFO"),
+        "handlers": ["console"]
+    }
+})
 logger = logging.getLogger("asistente")
 
 
+def _migrate_legacy_reset_tokens(inspector, existing_tables: set) -> None:
+    """
+    Recrea password_reset_tokens si aún guarda el token en claro.
+    
+    create_all no altera tablas existentes: en BDs creadas antes del cambio
+    a token_hash la tabla se descarta para que se cree con el esquema
+    actual. Los tokens pendientes se pierden (expiran en una hora y el
+    usuario puede pedir otro), igual que en la migración 6d4b9b2426b4.
+    """
+    table_name = "password_reset_tokens"
+    if table_name not in existing_tables:
+        return
+    columns = {c["name"] for c in inspector.get_columns(table_name)}
+    if "token" in columns:
+        logger.warning("⚠️ Migrando %s a token_hash (se descartan tokens pendientes)", table_name)
+        Base.metadata.tables[table_name].drop(bind=engine)
+        existing_tables.discard(table_name)
+
+
 def initialize_database():
     """
     Inicializa la base de datos creando tablas y roles si no existen.
     
-    Utiliza create_all con checkfirst=True para evitar recrear tablas existentes.
+    Refleja los nombres de tabla una vez y solo crea las que faltan.
     Inicializa roles solo si la tabla de roles está vacía.
     """
     try:
-        # Crear todas las tablas si no existen (checkfirst=True es el default)
-        Base.metadata.create_all(bind=engine)
+        # Una sola reflexión de nombres de tabla en lugar de un has_table()
+        # por tabla: en arranques con el esquema ya creado no se emite DDL
+        inspector = inspect(engine)
+        existing_tables = set(inspector.get_table_names())
+        _migrate_legacy_reset_tokens(inspector, existing_tables)
+        missing_tables = [
+            table for name, table in Base.metadata.tables.items()
+            if name not in existing_tables
+        ]
+        if missing_tables:
+            Base.metadata.create_all(bind=engine, tables=missing_tables)
         logger.info("✅ Tablas de base de datos verificadas/creadas")
         
         # Inicializar roles solo si no existen
         with SessionLocal() as db:
-            role_count = db.query(Role).count()
+            # Sondeo de existencia: para en la primera fila, sin COUNT(*)
+            has_roles = db.execute(select(Role.id).limit(1)).first() is not None
             
-            if role_count == 0:
+            if not has_roles:
                 logger.info("📋 Inicializando roles por primera vez...")
                 init_roles(db)
                 db.commit()
                 logger.info("✅ Roles inicializados correctamente")
             else:
-                logger.info(f"✅ Base de datos ya contiene {role_count} roles")
+                logger.info("✅ Base de datos ya contiene roles")
                 
     except Exception as e:
-        logger.error(f"❌ Error al inicializar la base de datos: {e}")
+        logger.error("❌ Error al inicializar la base de datos: %s", e)
         raise
 
 
-# Ejecutar inicialización al cargar el módulo
-initialize_database()
+def _include_deferred_routers(app: FastAPI) -> None:
+    """
+    Incluye routers con imports pesados (edge-tts, Gemini, RAG).
+    
+    Se llama desde el lifespan para sacarlos de la ruta crítica de
+    importación del módulo; idempotente si el lifespan se ejecuta
+    más de una vez (p.ej. varios TestClient).
+    """
+    if getattr(app.state, "deferred_routers_included", False):
+        return
+    from app.api.v1.routes.assistant import router as assist_router
+    app.include_router(assist_router)
+    app.state.deferred_routers_included = True
 
 
 @asynccontextmanager
@@ -86,7 +146,29 @@ async def lifespan(app: FastAPI):
         app (FastAPI): Instancia de la aplicación.
     """
     logger.info("🚀 Iniciando aplicación...")
+    # Validar configuración de ATHENIA una sola vez; el resultado queda
+    # en app.state.athenia_ok para que los endpoints puedan consultarlo
+    try:
+        settings.validate_athenia()
+        app.state.athenia_ok = True
+    except ValueError as e:
+        app.state.athenia_ok = False
+        logger.warning(
+            "⚠️ ATHENIA no está completamente configurado "
+            "(agrega GEMINI_API_KEY en el archivo .env): %s", e
+        )
+    _include_deferred_routers(app)
+    # DDL y seed síncronos en un hilo: no bloquean el event loop al arrancar
+    await asyncio.to_thread(initialize_database)
+    # Limpieza diaria de tokens de recuperación expirados
+    cleanup_task = asyncio.create_task(schedule_token_cleanup())
     yield
+    cleanup_task.cancel()
+    # Persistir la actividad de sesiones que quede en memoria
+    await asyncio.to_thread(flush_session_activity)
+    await asyncio.to_thread(shutdown_pdf_pool)
+    # Cerrar las conexiones del pool una sola vez al apagar
+    await asyncio.to_thread(engine.dispose)
     logger.info("🛑 Cerrando aplicación...")
 
 
@@ -102,33 +184,55 @@ app = FastAPI(
 # Incluir routers de endpoints
 app.include_router(auth_router)
 app.include_router(docs_router)
-app.include_router(assist_router)
+# El router del asistente se incluye en el lifespan (_include_deferred_routers)
 
 
-# Configurar middleware CORS
+# Configurar middleware CORS (ASGI puro, con credenciales y todos los métodos/headers)
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=ALLOWED_ORIGINS,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    FastCORSMiddleware,
+    allowed_origins=ALLOWED_ORIGINS,
 )
 
 
+# Respuesta de la raíz serializada una sola vez (health check frecuente)
+_ROOT_BYTES = orjson.dumps({
+    "status": "ok",
+    "message": "Asistente Documental API",
+    "version": "1.0.0"
+})
+
+
 @app.get("/")
 def root():
     """
     Endpoint raíz para verificar que la API está funcionando.
     
     Returns:
-        dict: Estado de la aplicación.
+        Response: Estado de la aplicación (JSON pre-serializado).
     """
-    return {
-        "status": "ok",
-        "message": "Asistente Documental API",
-        "version": "1.0.0"
-    }
+    return Response(content=_ROOT_BYTES, media_type="application/json")
 
 
 # Montar directorio de archivos estáticos
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# (con Cache-Control, y X-Accel-Redirect si USE_X_ACCEL indica que hay nginx delante)
+app.mount(
+    "/uploads",
+    CachedStaticFiles(directory="uploads", use_x_accel=settings.USE_X_ACCEL),
+    name="uploads"
+)
+
+
+if __name__ == "__main__":
+    import sys
+    import uvicorn
+    
+    # uvloop + httptools (implementaciones en C) salvo en Windows,
+    # donde uvloop no está disponible
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", 8000)),
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+    )